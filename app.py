@@ -7,16 +7,29 @@ from google.oauth2 import service_account
 from datetime import datetime, timedelta
 import time
 from io import BytesIO
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+from partes_pdf import generar_pdf, pdf_bytes
+from planificador import PlanificadorGoogle, codigo_http, error_permanente
+from diario import DiarioEscrituras
+from roster import peticiones_parte
+from correo import BandejaCorreo
 from gspread.utils import rowcol_to_a1
 import urllib.parse
 import base64 
+import os
+import json
+import uuid
+import sqlite3
+import threading
+import re
+import pickle
+import zlib
+import zipfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import wraps
+from bisect import bisect_left, bisect_right
 
 # --- CONFIGURACIÓN ---
 st.set_page_config(page_title="Gestor SEMI - Tablet", layout="wide", page_icon="🏗️")
@@ -62,6 +75,17 @@ st.markdown("""
 # --- IDs FIJOS ---
 ID_VEHICULOS = "19PWpeCz8pl5NEDpK-omX5AdrLuJgOPrn6uSjtUGomY8"
 ID_CONFIG_PROD = "1uCu5pq6l1CjqXKPEkGkN-G5Z5K00qiV9kR_bGOii6FU"
+RUTA_DIARIO = os.environ.get("SEMI_DIARIO", "diario_escrituras.db")
+RUTA_RESOLUCIONES = os.environ.get("SEMI_RESOLUCIONES", "resoluciones_ids.json")
+RUTA_INSTANTANEAS = os.environ.get("SEMI_INSTANTANEAS", "instantaneas.db")
+
+# --- COLUMNAS DE LAS HOJAS HR TRACK (base 1) ---
+# Producción solo lee estas columnas (lectura proyectada): una columna nueva se declara aquí
+COL_ITEM, COL_CIM, COL_CIM_FECHA, COL_POSTE, COL_POSTE_FECHA = 1, 3, 5, 6, 8   # A, C, E, F, H
+COLS_ANCLAJE, COLS_ANCLAJE_FECHA = [18, 21, 24, 27], [20, 23, 26, 29]         # tipos R,U,X,AA / fechas T,W,Z,AC
+COLS_MENSULA, COL_MENSULA_FECHA, COL_TENDIDO, COL_PLANO = [32, 33], 38, 39, 50  # AF:AG, AL, AM, AX
+COLUMNAS_TRACK = sorted({COL_ITEM, COL_CIM, COL_CIM_FECHA, COL_POSTE, COL_POSTE_FECHA, COL_MENSULA_FECHA, COL_TENDIDO, COL_PLANO,
+                         *COLS_ANCLAJE, *COLS_ANCLAJE_FECHA, *COLS_MENSULA})
 
 # ==========================================
 #            ESTADO GLOBAL
@@ -75,6 +99,7 @@ if 'ARCH_BACKUP' not in st.session_state: st.session_state.ARCH_BACKUP = None
 if 'veh_glob' not in st.session_state: st.session_state.veh_glob = None
 if 'lista_sel' not in st.session_state: st.session_state.lista_sel = []
 if 'prod_dia' not in st.session_state: st.session_state.prod_dia = {}
+if 'parte_pdf' not in st.session_state: st.session_state.parte_pdf = None
 if 'chk_giros' not in st.session_state: st.session_state.chk_giros = False
 if 'chk_aisl' not in st.session_state: st.session_state.chk_aisl = False
 if 'chk_comp' not in st.session_state: st.session_state.chk_comp = False
@@ -97,109 +122,622 @@ def get_gspread_client():
     creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
     return gspread.authorize(creds)
 
+# Métricas del proceso: cada llamada saliente (Google, SMTP) y cada rerun con su latencia, tamaño,
+# resultado y origen (página/pestaña de la sesión, o el nombre del hilo de fondo). Se ven en ?admin=1.
+class Metricas:
+    def __init__(self, maximo=5000):
+        self.lock = threading.Lock()
+        self.registros = deque(maxlen=maximo)  # {"t", "op", "ms", "bytes", "resultado", "origen", "llamadas"}
+        self.totales = {}  # (op, origen, resultado) -> [n, ms, bytes], acumulados desde el arranque
+        self.ctx = threading.local()
+
+    def origen(self):
+        return getattr(self.ctx, "origen", None) or re.sub(r"_\d+$", "", threading.current_thread().name)
+
+    def fijar_origen(self, origen): self.ctx.origen = origen
+
+    def registrar(self, op, ms, tamano=0, resultado="ok", llamadas=None, google=False):
+        origen = self.origen()
+        if google: self.ctx.llamadas = getattr(self.ctx, "llamadas", 0) + 1
+        with self.lock:
+            self.registros.append({"t": time.time(), "op": op, "ms": ms, "bytes": tamano, "resultado": resultado, "origen": origen, "llamadas": llamadas})
+            tot = self.totales.setdefault((op, origen, resultado), [0, 0.0, 0])
+            tot[0] += 1; tot[1] += ms; tot[2] += tamano
+
+    @contextmanager
+    def medir(self, op, tamano=0):
+        t0, resultado = time.perf_counter(), "ok"
+        try: yield
+        except Exception as e:
+            resultado = type(e).__name__; raise
+        finally: self.registrar(op, (time.perf_counter() - t0) * 1000, tamano, resultado)
+
+    def inicio_rerun(self, pagina):
+        # Un st.rerun() o una excepción cortan el script antes de fin_rerun: si el hilo sigue con un
+        # rerun abierto, se cierra aquí como interrumpido para no perder su tiempo ni sus llamadas
+        if getattr(self.ctx, "en_pagina", False): self.fin_rerun(self.ctx.pagina, resultado="interrumpido")
+        self.ctx.origen, self.ctx.pagina, self.ctx.llamadas, self.ctx.t0, self.ctx.en_pagina = f"{pagina}/SIDEBAR", pagina, 0, time.perf_counter(), True
+
+    def fin_rerun(self, pagina, resultado="ok"):
+        if not getattr(self.ctx, "en_pagina", False): return
+        self.fijar_origen(pagina)
+        self.registrar("rerun", (time.perf_counter() - self.ctx.t0) * 1000, resultado=resultado, llamadas=self.ctx.llamadas)
+        self.ctx.en_pagina = False
+
+    @contextmanager
+    def fragmento(self, origen):
+        # Dentro del rerun de la página solo cambia el origen; un rerun del fragmento solo se registra aparte
+        previo, solo = getattr(self.ctx, "origen", None), not getattr(self.ctx, "en_pagina", False)
+        llamadas, t0 = getattr(self.ctx, "llamadas", 0), time.perf_counter()
+        self.fijar_origen(origen)
+        try: yield
+        finally:
+            if solo: self.registrar("rerun", (time.perf_counter() - t0) * 1000, llamadas=getattr(self.ctx, "llamadas", 0) - llamadas)
+            self.fijar_origen(previo)
+
+    def tabla(self):
+        with self.lock: return list(self.registros)
+
+    def vaciar(self):
+        with self.lock: self.registros.clear(); self.totales.clear()
+
+    def prometheus(self):
+        with self.lock: totales, registros = dict(self.totales), list(self.registros)
+        lineas = []
+        for metrica, i, ayuda in (("semi_llamadas_total", 0, "Llamadas salientes y reruns"),
+                                  ("semi_llamadas_ms_total", 1, "Milisegundos acumulados"),
+                                  ("semi_llamadas_bytes_total", 2, "Bytes enviados + recibidos")):
+            lineas += [f"# HELP {metrica} {ayuda}", f"# TYPE {metrica} counter"]
+            for (op, origen, resultado), v in sorted(totales.items()):
+                lineas.append(f'{metrica}{{op="{op}",origen="{origen}",resultado="{resultado}"}} {round(v[i], 3)}')
+        lineas += ["# HELP semi_latencia_ms Latencia por operación (últimos registros)", "# TYPE semi_latencia_ms summary"]
+        por_op = {}
+        for r in registros: por_op.setdefault(r["op"], []).append(r["ms"])
+        for op, ms in sorted(por_op.items()):
+            ms.sort()
+            for q in (0.5, 0.9, 0.99): lineas.append(f'semi_latencia_ms{{op="{op}",quantile="{q}"}} {round(ms[min(len(ms) - 1, int(q * len(ms)))], 1)}')
+            lineas.append(f'semi_latencia_ms_count{{op="{op}"}} {len(ms)}')
+        return "\n".join(lineas) + "\n"
+
+@st.cache_resource
+def get_metricas():
+    return Metricas()
+
+# Cuotas, reintentos y carriles: ver planificador.py
+@st.cache_resource
+def get_planificador():
+    return PlanificadorGoogle(metricas=get_metricas())
+
+def llamar_google(fn, *args, tipo="lectura", op=None, **kwargs):
+    return get_planificador().llamar(tipo, fn, *args, op=op, **kwargs)
+
+# Handles de Spreadsheet/Worksheet compartidos por todo el proceso (LRU + TTL).
+# Las resoluciones nombre -> ID se guardan en disco: la búsqueda lenta por nombre se hace una vez por despliegue.
+# Una referencia que Google dice que no existe no se vuelve a buscar hasta pasados ttl_sin_libro segundos.
+def sin_libro(e):
+    return isinstance(e, gspread.SpreadsheetNotFound) or error_permanente(e)
+
+class CacheHandles:
+    def __init__(self, ruta_ids, maximo=32, ttl=1800, ttl_sin_libro=600):
+        self.ruta_ids, self.maximo, self.ttl, self.ttl_sin_libro = ruta_ids, maximo, ttl, ttl_sin_libro
+        self.lock = threading.RLock()
+        self.libros = OrderedDict()  # referencia -> (t, Spreadsheet)
+        self.no_existen = {}         # referencia -> t de la última búsqueda sin resultado
+        self.hojas = OrderedDict()   # id spreadsheet -> (t, [Worksheet])
+        self.versiones = {}          # id spreadsheet -> versión de Drive del último sondeo
+        try:
+            with open(ruta_ids, encoding="utf-8") as f: self.ids = json.load(f)
+        except: self.ids = {}
+
+    def _guardar_ids(self):
+        try:
+            tmp = f"{self.ruta_ids}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(self.ids, f)
+            os.replace(tmp, self.ruta_ids)
+        except: pass
+
+    def _resolver(self, client, referencia):
+        # (sh, no_existe): no_existe solo si todas las búsquedas dieron "no encontrado", no si falló la red
+        try: return llamar_google(client.open_by_key, self.ids.get(referencia, referencia)), False
+        except Exception as e: no_existe = sin_libro(e)
+        for nombre in (referencia, referencia.replace(".xlsx", "")):
+            try: sh = llamar_google(client.open, nombre)
+            except Exception as e:
+                no_existe = no_existe and sin_libro(e); continue
+            with self.lock:
+                self.ids[referencia] = sh.id; self._guardar_ids()
+            return sh, False
+        return None, no_existe
+
+    def _vigente(self, cache, clave):
+        entrada = cache.get(clave)
+        if not entrada or time.time() - entrada[0] >= self.ttl: return None
+        cache.move_to_end(clave)
+        return entrada[1]
+
+    def _meter(self, cache, clave, valor):
+        cache[clave] = (time.time(), valor); cache.move_to_end(clave)
+        while len(cache) > self.maximo: cache.popitem(last=False)
+
+    def libro(self, client, referencia):
+        with self.lock:
+            sh = self._vigente(self.libros, referencia)
+            if sh is None and time.time() - self.no_existen.get(referencia, 0) < self.ttl_sin_libro: return None
+        if sh: return sh
+        sh, no_existe = self._resolver(client, referencia)
+        with self.lock:
+            if sh: self._meter(self.libros, referencia, sh); self.no_existen.pop(referencia, None)
+            elif no_existe: self.no_existen[referencia] = time.time()
+        return sh
+
+    def pestanas(self, sh, refrescar=False):
+        with self.lock: hojas = None if refrescar else self._vigente(self.hojas, sh.id)
+        if hojas is None:
+            hojas = llamar_google(sh.worksheets)  # un solo fetch_sheet_metadata trae todas las pestañas
+            with self.lock: self._meter(self.hojas, sh.id, hojas)
+        return hojas
+
+    def hoja(self, sh, titulo):
+        ws = next((w for w in self.pestanas(sh) if w.title == titulo), None)
+        if ws is None: ws = next((w for w in self.pestanas(sh, refrescar=True) if w.title == titulo), None)
+        if ws is None: raise gspread.WorksheetNotFound(titulo)
+        return ws
+
+    def invalidar(self, sh):
+        with self.lock: self.hojas.pop(sh.id, None)
+
+    def anotar_versiones(self, versiones):
+        # Versión nueva en Drive: alguien pudo añadir o renombrar pestañas, la lista cacheada ya no vale.
+        # Devuelve los archivos que cambiaron
+        cambiados = set()
+        with self.lock:
+            for file_id, version in versiones.items():
+                if self.versiones.get(file_id, version) != version: self.hojas.pop(file_id, None); cambiados.add(file_id)
+                self.versiones[file_id] = version
+        return cambiados
+
+    def adoptar_version(self, file_id, version):
+        # Versión que dejó una escritura propia: no invalida nada. Devuelve la del sondeo anterior
+        with self.lock:
+            previa = self.versiones.get(file_id); self.versiones[file_id] = version
+            return previa
+
+@st.cache_resource
+def get_cache_handles():
+    return CacheHandles(RUTA_RESOLUCIONES)
+
 def conectar_flexible(referencia):
-    client = get_gspread_client()
-    try: return client.open_by_key(referencia)
-    except:
-        try: return client.open(referencia)
-        except:
-            try: return client.open(referencia.replace(".xlsx", ""))
-            except: return None
+    t0 = time.perf_counter()
+    try: sh = get_cache_handles().libro(get_gspread_client(), referencia)
+    except: sh = None
+    get_metricas().registrar("conectar_flexible", (time.perf_counter() - t0) * 1000, resultado="ok" if sh else "sin_libro")
+    return sh
+
+def hojas_libro(sh): return get_cache_handles().pestanas(sh)
+def abrir_hoja(sh, titulo): return get_cache_handles().hoja(sh, titulo)
+def invalidar_hojas(sh): get_cache_handles().invalidar(sh)
 
 def safe_val(lista, indice):
     idx_py = indice - 1
     if idx_py < len(lista): return lista[idx_py]
     return None
 
-def leer_nota_directa(nombre_archivo, nombre_hoja, fila, col):
-    try:
-        sh = conectar_flexible(nombre_archivo)
-        ws = sh.worksheet(nombre_hoja)
-        return ws.cell(fila, col).note or ""
-    except: return ""
+def parsear_nota(nota):
+    # Notas de producción: "📅 fecha - hora / 🚛 vehículo / 👷 usuario / ⚠️ extra (Tramo: A -> B)"
+    campos = {"texto": nota, "fecha": "", "hora": "", "vehiculo": "", "usuario": "", "extra": "", "tramo": None}
+    for linea in nota.split("\n"):
+        linea = linea.strip()
+        if linea.startswith("📅"):
+            m = re.match(r"^(.*?)\s*-\s*(\d{1,2}:\d{2})$", linea[len("📅"):].strip())
+            if m: campos["fecha"], campos["hora"] = m.group(1), m.group(2)
+        elif linea.startswith("🚛"): campos["vehiculo"] = linea[len("🚛"):].strip()
+        elif linea.startswith("👷"): campos["usuario"] = linea[len("👷"):].strip()
+        elif linea.startswith("⚠️"): campos["extra"] = linea[len("⚠️"):].strip()
+    if "Tramo:" in nota:
+        tramo = nota.split("Tramo:")[1].split("\n")[0].strip()
+        campos["tramo"] = tuple(p.strip() for p in tramo.split("->"))
+    return campos
 
 # ==========================================
 #        ROBOT: FORMATOS Y ESTILOS
 # ==========================================
-def cambiar_formato_google(ws, fila, col, tipo_estilo):
-    try:
-        formato_texto = {"fontFamily": "Arial", "foregroundColor": {"red": 0.0, "green": 0.0, "blue": 0.0}, "bold": False}
-        formato_fondo = None 
-        if tipo_estilo == "GIROS":
-            formato_texto = {"fontFamily": "Courier New", "foregroundColor": {"red": 1.0, "green": 0.0, "blue": 0.0}, "bold": True}
-        elif tipo_estilo == "AISLADORES":
-            formato_texto = {"fontFamily": "Times New Roman", "foregroundColor": {"red": 0.0, "green": 0.0, "blue": 1.0}, "bold": True}
-        elif tipo_estilo == "TENDIDO_AZUL":
-            formato_texto = {"fontFamily": "Arial", "foregroundColor": {"red": 0.0, "green": 0.0, "blue": 0.0}, "bold": True}
-            formato_fondo = {"red": 0.4, "green": 0.6, "blue": 1.0} 
-        elif tipo_estilo == "GRAPADO_VERDE":
-            formato_texto = {"fontFamily": "Arial", "foregroundColor": {"red": 0.0, "green": 0.0, "blue": 0.0}, "bold": True}
-            formato_fondo = {"red": 0.4, "green": 0.9, "blue": 0.4} 
-        user_format = {"textFormat": formato_texto}
-        if formato_fondo: user_format["backgroundColor"] = formato_fondo
-        campos = "userEnteredFormat(textFormat,backgroundColor)"
-        body = {"requests": [{"repeatCell": {"range": {"sheetId": ws.id, "startRowIndex": fila - 1, "endRowIndex": fila, "startColumnIndex": col - 1, "endColumnIndex": col}, "cell": {"userEnteredFormat": user_format}, "fields": campos}}]}
-        ws.spreadsheet.batch_update(body)
-        return True
-    except Exception as e: return False
-
-def detectar_estilo_celda(ws, fila, col):
-    try:
-        nombre_hoja = ws.title
-        rango = f"{nombre_hoja}!{rowcol_to_a1(fila, col)}"
-        res = ws.spreadsheet.fetch_sheet_metadata(params={'includeGridData': True, 'ranges': [rango]})
+def formato_estilo(tipo_estilo):
+    formato_texto = {"fontFamily": "Arial", "foregroundColor": {"red": 0.0, "green": 0.0, "blue": 0.0}, "bold": False}
+    formato_fondo = None 
+    if tipo_estilo == "GIROS":
+        formato_texto = {"fontFamily": "Courier New", "foregroundColor": {"red": 1.0, "green": 0.0, "blue": 0.0}, "bold": True}
+    elif tipo_estilo == "AISLADORES":
+        formato_texto = {"fontFamily": "Times New Roman", "foregroundColor": {"red": 0.0, "green": 0.0, "blue": 1.0}, "bold": True}
+    elif tipo_estilo == "TENDIDO_AZUL":
+        formato_texto = {"fontFamily": "Arial", "foregroundColor": {"red": 0.0, "green": 0.0, "blue": 0.0}, "bold": True}
+        formato_fondo = {"red": 0.4, "green": 0.6, "blue": 1.0} 
+    elif tipo_estilo == "GRAPADO_VERDE":
+        formato_texto = {"fontFamily": "Arial", "foregroundColor": {"red": 0.0, "green": 0.0, "blue": 0.0}, "bold": True}
+        formato_fondo = {"red": 0.4, "green": 0.9, "blue": 0.4} 
+    user_format = {"textFormat": formato_texto}
+    if formato_fondo: user_format["backgroundColor"] = formato_fondo
+    return user_format
+
+def clasificar_formato(formato):
+    font_family = formato.get('textFormat', {}).get('fontFamily', 'Arial')
+    bg_color = formato.get('backgroundColor', {})
+    if bg_color.get('blue', 0) > 0.8 and bg_color.get('red', 0) < 0.6: return "TENDIDO_AZUL"
+    if bg_color.get('green', 0) > 0.7 and bg_color.get('blue', 0) < 0.6: return "GRAPADO_VERDE"
+    if 'Courier' in font_family: return "GIROS"
+    elif 'Times' in font_family: return "AISLADORES"
+    return "NORMAL"
+
+def letra_col(col): return rowcol_to_a1(1, col)[:-1]
+
+# Columnas cuyo formato lleva el estado: H (poste: giros/aisladores) y AM (tendido azul / grapado verde)
+COLS_ESTILO = {col: letra_col(col) for col in (COL_POSTE_FECHA, COL_TENDIDO)}
+
+def cargar_indice_celdas(sh, nombre_hoja):
+    # Un solo fetch con grid data de las columnas H y AM: fuente, fondo y nota.
+    # Devuelve ({fila: {col: estilo}}, {fila: {col: nota parseada}})
+    res = llamar_google(sh.fetch_sheet_metadata, params={
+        'includeGridData': True, 'ranges': [f"'{nombre_hoja}'!{l}:{l}" for l in COLS_ESTILO.values()],
+        'fields': "sheets(data(startRow,startColumn,rowData(values(note,userEnteredFormat(textFormat(fontFamily),backgroundColor)))))"})
+    estilos, notas = {}, {}
+    for bloque in res['sheets'][0].get('data', []):
+        col, fila0 = bloque.get('startColumn', 0) + 1, bloque.get('startRow', 0) + 1
+        for i, fila in enumerate(bloque.get('rowData', [])):
+            celda = (fila.get('values') or [{}])[0]
+            estilo = clasificar_formato(celda.get('userEnteredFormat', {}))
+            if estilo != "NORMAL": estilos.setdefault(fila0 + i, {})[col] = estilo
+            if celda.get('note'): notas.setdefault(fila0 + i, {})[col] = parsear_nota(celda['note'])
+    return estilos, notas
+
+# ==========================================
+#     MOTOR DE COMMIT (1 batchUpdate / ARCHIVO)
+# ==========================================
+# Valor + nota + formato de una o varias celdas en un único spreadsheets.batchUpdate (updateCells)
+# numberFormat solo entra en la máscara si la celda lo fija (fechas): si no, se borraría el formato que ya tenga
+CAMPOS_COMMIT = "userEnteredValue,note,userEnteredFormat(textFormat,backgroundColor)"
+CAMPOS_COMMIT_FECHA = "userEnteredValue,note,userEnteredFormat(textFormat,backgroundColor,numberFormat)"
+FORMATO_FECHA = {"type": "DATE", "pattern": "dd/mm/yyyy"}
+
+def valor_usuario(valor):
+    # Igual que USER_ENTERED en update_cell: las fechas dd/mm/aaaa se guardan como fecha real
+    if valor is None or valor == "": return None
+    if isinstance(valor, (int, float)): return {"numberValue": valor}
+    try: return {"numberValue": (datetime.strptime(str(valor), "%d/%m/%Y") - datetime(1899, 12, 30)).days}
+    except ValueError: return {"stringValue": str(valor)}
+
+def celda_api(valor, nota, estilo):
+    fmt = formato_estilo(estilo or "NORMAL")
+    uv = valor_usuario(valor)
+    celda = {"userEnteredFormat": fmt, "note": nota or ""}
+    if uv:
+        celda["userEnteredValue"] = uv
+        if not isinstance(valor, (int, float)) and "numberValue" in uv: fmt["numberFormat"] = FORMATO_FECHA
+    return celda
+
+def peticiones_commit(sheet_id, celdas):
+    # celdas: [{"fila", "col", "valor", "nota", "estilo"}] (fila/col en base 1, como gspread)
+    # Filas consecutivas de una misma columna (tramos TENDIDO/GRAPADO) van en un solo updateCells
+    # (la máscara es por updateCells: solo se juntan filas con la misma)
+    peticiones, previa = [], None
+    for c in sorted(celdas, key=lambda c: (c['col'], c['fila'])):
+        celda = celda_api(c['valor'], c.get('nota'), c.get('estilo'))
+        campos = CAMPOS_COMMIT_FECHA if "numberFormat" in celda["userEnteredFormat"] else CAMPOS_COMMIT
+        fila_api = {"values": [celda]}
+        if previa == (c['col'], c['fila'] - 1, campos): peticiones[-1]["updateCells"]["rows"].append(fila_api)
+        else:
+            peticiones.append({"updateCells": {
+                "start": {"sheetId": sheet_id, "rowIndex": c['fila'] - 1, "columnIndex": c['col'] - 1},
+                "rows": [fila_api], "fields": campos}})
+        previa = (c['col'], c['fila'], campos)
+    return peticiones
+
+def commit_celdas(sh, celdas_por_hoja):
+    # Todas las hojas del archivo en un solo batchUpdate (atómico)
+    peticiones = []
+    for hoja, celdas in celdas_por_hoja.items(): peticiones += peticiones_commit(abrir_hoja(sh, hoja).id, celdas)
+    if not peticiones: return None
+    return llamar_google(sh.batch_update, {"requests": peticiones}, tipo="escritura")
+
+# ==========================================
+#     INSTANTÁNEAS EN DISCO
+# ==========================================
+# Último valor bueno de cada carga (roster, config, vehículos, pestañas y filas HR TRACK) en
+# SQLite, con la hora de carga y la versión de Drive. Tras un reinicio se sirve al momento y
+# se refresca en segundo plano; con varias réplicas (WAL) una lee lo que descargó otra.
+class InstantaneasDisco:
+    def __init__(self, ruta):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS instantaneas (clave TEXT PRIMARY KEY, t REAL, datos BLOB)")
+        self.db.commit()
+
+    def leer(self, clave):
+        try:
+            with self.lock: fila = self.db.execute("SELECT t, datos FROM instantaneas WHERE clave=?", (json.dumps(clave),)).fetchone()
+            if fila:
+                version, valor = pickle.loads(zlib.decompress(fila[1]))
+                return {"t": fila[0], "version": version, "valor": valor}
+        except Exception: pass  # instantánea ilegible (p.ej. de otra versión del código): se descarga
+        return None
+
+    def guardar(self, clave, valor, version=None, t=None):
         try:
-            celda_data = res['sheets'][0]['data'][0]['rowData'][0]['values'][0]
-            formato = celda_data.get('userEnteredFormat', {})
-            font_family = formato.get('textFormat', {}).get('fontFamily', 'Arial')
-            bg_color = formato.get('backgroundColor', {})
-            if bg_color.get('blue', 0) > 0.8 and bg_color.get('red', 0) < 0.6: return "TENDIDO_AZUL"
-            if bg_color.get('green', 0) > 0.7 and bg_color.get('blue', 0) < 0.6: return "GRAPADO_VERDE"
-            if 'Courier' in font_family: return "GIROS"
-            elif 'Times' in font_family: return "AISLADORES"
-            return "NORMAL"
-        except: return "NORMAL"
-    except: return "NORMAL"
+            datos = zlib.compress(pickle.dumps((version, valor), protocol=pickle.HIGHEST_PROTOCOL))
+            with self.lock:
+                self.db.execute("INSERT OR REPLACE INTO instantaneas (clave, t, datos) VALUES (?,?,?)", (json.dumps(clave), t or time.time(), datos))
+                self.db.commit()
+        except Exception: pass  # el disco es solo un atajo: si falla se sigue con la memoria
+
+@st.cache_resource
+def get_instantaneas():
+    return InstantaneasDisco(RUTA_INSTANTANEAS)
 
 # ==========================================
 #        CARGA DE DATOS (CACHÉ)
 # ==========================================
-@st.cache_data(ttl=300) 
-def cargar_datos_completos_hoja(nombre_archivo, nombre_hoja):
+def rangos_columnas(cols, hueco=1):
+    # Columnas -> rangos (desde, hasta); se unen huecos de una columna para pedir menos rangos
+    rangos = []
+    for c in sorted(cols):
+        if rangos and c - rangos[-1][1] <= hueco + 1: rangos[-1][1] = c
+        else: rangos.append([c, c])
+    return [tuple(r) for r in rangos]
+
+def leer_columnas_track(sh, nombre_hoja):
+    # Un solo values.batchGet con COLUMNAS_TRACK unidas por rangos_columnas (A:H, R:AC, AF:AG, AL:AM, AX:AX).
+    # Las filas se rearman en su posición de columna, igual que get_all_values, para que safe_val siga valiendo.
+    rangos = rangos_columnas(COLUMNAS_TRACK)
+    res = llamar_google(sh.values_batch_get, [f"'{nombre_hoja}'!{letra_col(a)}:{letra_col(b)}" for a, b in rangos],
+                              params={"valueRenderOption": "FORMATTED_VALUE", "majorDimension": "ROWS"})
+    ancho, filas = max(COLUMNAS_TRACK), []
+    for (desde, hasta), bloque in zip(rangos, res.get("valueRanges", [])):
+        for i, valores in enumerate(bloque.get("values", [])):
+            while len(filas) <= i: filas.append([""] * ancho)
+            filas[i][desde - 1:desde - 1 + len(valores)] = valores[:hasta - desde + 1]
+    return filas
+
+def descargar_hoja_track(nombre_archivo, nombre_hoja):
     sh = conectar_flexible(nombre_archivo)
     if not sh: return None
     try:
-        ws = sh.worksheet(nombre_hoja)
-        todos_los_datos = ws.get_all_values() 
+        todos_los_datos = leer_columnas_track(sh, nombre_hoja)
+        # Sin estilos ni notas la hoja saldría entera NORMAL y sin tramos: mejor fallar y servir lo último bueno
+        estilos, notas = cargar_indice_celdas(sh, nombre_hoja)
         datos_procesados = {}
         for i, fila in enumerate(todos_los_datos):
             if not fila: continue
-            item_id = str(fila[0]).strip()
+            item_id = str(fila[COL_ITEM - 1]).strip()
             if len(item_id) > 2 and "ITEM" not in item_id.upper() and "HR TRACK" not in item_id.upper():
-                # --- AQUÍ INTENTAMOS LEER EL LINK DEL PDF SI EXISTE (Ej. Columna 50) ---
-                link_pdf = safe_val(fila, 50) # Asumiendo que está en la columna AX, ajusta esto luego
-                datos_procesados[item_id] = {"fila_excel": i + 1, "datos": fila, "link_pdf": link_pdf}
+                # --- AQUÍ INTENTAMOS LEER EL LINK DEL PDF SI EXISTE (Columna AX) ---
+                link_pdf = safe_val(fila, COL_PLANO)
+                datos_procesados[item_id] = {"fila_excel": i + 1, "datos": fila, "link_pdf": link_pdf, "estilos": estilos.get(i + 1, {}), "notas": notas.get(i + 1, {})}
         return datos_procesados
     except: return None
 
-@st.cache_data(ttl=300)
-def buscar_archivos_roster():
+# Punto kilométrico: "34+200" -> 34200 m; "34.2" / "34,2" (km con decimales) -> 34200 m
+PATRON_PK = re.compile(r"(\d+)\s*\+\s*(\d{1,3})")
+PATRON_KM_DECIMAL = re.compile(r"(\d+)[.,](\d+)")
+
+def pk_a_metros(texto):
+    m = PATRON_PK.search(str(texto))
+    if m: return int(m.group(1)) * 1000 + int(m.group(2))
+    m = PATRON_KM_DECIMAL.search(str(texto))
+    if m: return float(f"{m.group(1)}.{m.group(2)}") * 1000
+    return None
+
+def construir_indices(datos):
+    # Índices invertidos valor -> perfiles, construidos una vez por carga de la hoja
+    orden = list(datos.keys())
+    pks = sorted((pk_a_metros(k), k) for k in orden if pk_a_metros(k) is not None)
+    cim, post, anc = {}, {}, {}
+    textos, trigramas = {}, {}
+    for k, info in datos.items():
+        row = info['datos']
+        v = safe_val(row, COL_CIM)
+        if v: cim.setdefault(v, set()).add(k)
+        v = safe_val(row, COL_POSTE)
+        if v: post.setdefault(v, set()).add(k)
+        for c in COLS_ANCLAJE:
+            v = safe_val(row, c)
+            if v: anc.setdefault(v, set()).add(k)
+        # Buscador: ID de perfil y nombre de poste (columna F), normalizados
+        textos[k] = tuple(t for t in {normalizar_busqueda(k), normalizar_busqueda(safe_val(row, COL_POSTE) or "")} if t)
+        for t in textos[k]:
+            for g in trigramas_de(t): trigramas.setdefault(g, set()).add(k)
+    busqueda = sorted((t, k) for k, ts in textos.items() for t in ts)
+    return {"orden": orden, "pos": {k: i for i, k in enumerate(orden)}, "ids_ordenados": sorted(orden),
+            "pk_metros": [m for m, _ in pks], "pk_ids": [k for _, k in pks],
+            "cim": cim, "post": post, "anc": anc,
+            "list_cim": sorted(cim), "list_post": sorted(post), "list_anc": sorted(anc),
+            "busqueda_textos": [t for t, _ in busqueda], "busqueda_ids": [k for _, k in busqueda],
+            "textos": textos, "trigramas": trigramas}
+
+def normalizar_busqueda(texto): return re.sub(r"\s+", "", str(texto)).upper()
+
+def trigramas_de(texto): return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+def buscar_perfiles(indices, consulta, candidatos=None):
+    # Exactos, luego por prefijo y luego por subcadena (trigramas), cada grupo en el orden de la hoja.
+    # Sin consulta devuelve los candidatos tal cual.
+    orden = list(indices["orden"]) if candidatos is None else list(candidatos)
+    q = normalizar_busqueda(consulta)
+    if not q: return orden
+    validos = set(orden)
+    textos, ids = indices["busqueda_textos"], indices["busqueda_ids"]
+    prefijo = set(ids[bisect_left(textos, q):bisect_left(textos, q + "\uffff")]) & validos
+    exactos = {k for k in prefijo if q in indices["textos"][k]}
+    subcadena = set()
+    if len(q) >= 3:
+        grupos = sorted((indices["trigramas"].get(g, set()) for g in trigramas_de(q)), key=len)
+        subcadena = {k for k in set.intersection(*grupos) & validos if any(q in t for t in indices["textos"][k])} - prefijo
+    pos = indices["pos"]
+    return [k for grupo in (exactos, prefijo - exactos, subcadena) for k in sorted(grupo, key=pos.__getitem__)]
+
+def filtrar_perfiles(indices, fil_cim, fil_post, fil_anc):
+    # Filtro combinado = intersección de conjuntos, devuelta en el orden de la hoja
+    conjuntos = [indices[n].get(v, set()) for n, v in (("cim", fil_cim), ("post", fil_post), ("anc", fil_anc)) if v != "Todos"]
+    if not conjuntos: return list(indices["orden"])
+    return sorted(set.intersection(*sorted(conjuntos, key=len)), key=indices["pos"].__getitem__)
+
+def perfil_mas_cercano(indices, metros):
+    pk = indices["pk_metros"]
+    if not pk: return None
+    i = bisect_left(pk, metros)
+    vecinos = [j for j in (i - 1, i) if 0 <= j < len(pk)]
+    return indices["pk_ids"][min(vecinos, key=lambda j: abs(pk[j] - metros))]
+
+def rango_pk(consulta):
+    # "34+200-35+100", "34+200 a 35+100" o "34+200..35+100" -> (desde_m, hasta_m) o None
+    m = re.match(r"^(.+?)\s*(?:\.\.|\s+a\s+|-)\s*(.+)$", consulta.strip())
+    if not m: return None
+    a, b = pk_a_metros(m.group(1)), pk_a_metros(m.group(2))
+    if a is None or b is None: return None
+    return min(a, b), max(a, b)
+
+def consultar_km(indices, consulta):
+    # Devuelve (perfiles que cumplen o None si no filtra, perfil más cercano al PK tecleado o None)
+    consulta = consulta.strip()
+    if not consulta: return None, None
+    rango = rango_pk(consulta)
+    if rango:
+        pk = indices["pk_metros"]
+        return set(indices["pk_ids"][bisect_left(pk, rango[0]):bisect_right(pk, rango[1])]), None
+    if consulta.startswith("="):
+        exacto = consulta[1:].strip()
+        metros = pk_a_metros(exacto)
+        if exacto in indices["pos"]: return {exacto}, exacto
+        if metros is None: return set(), None
+        pk = indices["pk_metros"]
+        return set(indices["pk_ids"][bisect_left(pk, metros):bisect_right(pk, metros)]), None
+    ids = indices["ids_ordenados"]
+    prefijo = set(ids[bisect_left(ids, consulta):bisect_left(ids, consulta + "\uffff")])
+    metros = pk_a_metros(consulta)
+    cercano = perfil_mas_cercano(indices, metros) if metros is not None else None
+    # Un PK que no es prefijo de ningún perfil no filtra: salta al perfil más cercano
+    if not prefijo and cercano: return None, cercano
+    return prefijo, cercano if cercano in prefijo else None
+
+# Filas de las hojas HR TRACK compartidas por todas las sesiones. Tras un commit solo se
+# parchean las celdas escritas. Si hay sondeo de Drive (version/modifiedTime) la hoja se sirve
+# mientras el archivo no cambie; sin sondeo se vuelve al TTL. El botón de recarga fuerza la descarga.
+# La primera lectura tras un reinicio sale de la instantánea en disco si la hay.
+TTL_HOJAS = 300
+
+class AlmacenHojas:
+    def __init__(self, descargar, indexar, version=None, ttl=TTL_HOJAS, disco=None):
+        self.descargar, self.indexar, self.version, self.ttl, self.disco = descargar, indexar, version, ttl, disco
+        self.lock = threading.Lock()
+        self.entradas = {}  # (archivo, hoja) -> {"t", "version", "datos", "por_fila", "indices"}
+        self.cerrojos = {}  # (archivo, hoja) -> Lock: una sola descarga a la vez por hoja
+        self.en_fondo = set()  # hojas servidas desde disco que se están descargando
+        self.pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hojas")
+
+    def _fresca(self, e, desde, version):
+        if not e or e["t"] < desde: return False
+        if version is not None and e["version"] is not None: return version == e["version"]
+        return time.time() - e["t"] < self.ttl
+
+    def _entrada(self, datos, version, t):
+        return {"t": t, "version": version, "datos": datos, "por_fila": {info["fila_excel"]: k for k, info in datos.items()},
+                "indices": self.indexar(datos)}
+
+    def obtener(self, archivo, hoja, refrescar=False):
+        clave, pedido = (archivo, hoja), time.time()
+        desde = pedido if refrescar else 0
+        # Versión del último sondeo, tomada antes de descargar: un cambio durante la descarga provoca otra
+        version = self.version(archivo) if self.version else None
+        with self.lock:
+            e = self.entradas.get(clave)
+            if self._fresca(e, desde, version): return e
+            if e and not refrescar and clave in self.en_fondo: return e
+            cerrojo = self.cerrojos.setdefault(clave, threading.Lock())
+        if e is None and not refrescar and self.disco:
+            e = self._de_disco(clave)
+            if e and not self._fresca(e, 0, version):
+                # Instantánea vieja: se sirve ya y la hoja se descarga en segundo plano
+                with self.lock: self.en_fondo.add(clave)
+                self.pool.submit(self._en_fondo, clave, cerrojo, version)
+            if e: return e
+        return self._descargar(clave, cerrojo, desde, version)
+
+    def _de_disco(self, clave):
+        snap = self.disco.leer(("hoja",) + clave)
+        if not snap: return None
+        e = self._entrada(snap["valor"], snap["version"], snap["t"])  # los índices se rehacen al leer
+        with self.lock: return self.entradas.setdefault(clave, e)
+
+    def _en_fondo(self, clave, cerrojo, version):
+        try: self._descargar(clave, cerrojo, 0, version)
+        finally:
+            with self.lock: self.en_fondo.discard(clave)
+
+    def _descargar(self, clave, cerrojo, desde, version):
+        with cerrojo:
+            with self.lock: e = self.entradas.get(clave)
+            if self._fresca(e, desde, version): return e  # la descargó otra sesión mientras esperábamos
+            datos = self.descargar(*clave)
+            if datos is None: return e  # sin red: mejor lo último bueno que nada
+            nueva = self._entrada(datos, version, time.time())
+            with self.lock: self.entradas[clave] = nueva
+            if self.disco: self.disco.guardar(("hoja",) + clave, datos, version, nueva["t"])
+            return nueva
+
+    def adoptar_version(self, archivo, previa, nueva):
+        # Tras una escritura propia ya parcheada, las hojas del archivo que estaban al día lo siguen en la versión nueva
+        with self.lock:
+            for (a, _), e in self.entradas.items():
+                if a == archivo and e["version"] == previa: e["version"] = nueva
+
+    def parchear(self, archivo, hoja, celdas):
+        with self.lock:
+            e = self.entradas.get((archivo, hoja))
+            if not e: return
+            for c in celdas:
+                item_id = e["por_fila"].get(c["fila"])
+                if item_id is None: continue
+                viejo = e["datos"][item_id]
+                fila = list(viejo["datos"]) + [""] * max(0, c["col"] - len(viejo["datos"]))
+                fila[c["col"] - 1] = "" if c["valor"] is None else str(c["valor"])
+                estilos, notas = dict(viejo["estilos"]), dict(viejo["notas"])
+                if c["col"] in COLS_ESTILO:
+                    estilos.pop(c["col"], None); notas.pop(c["col"], None)
+                    if c.get("estilo") and c["estilo"] != "NORMAL": estilos[c["col"]] = c["estilo"]
+                    if c.get("nota"): notas[c["col"]] = parsear_nota(c["nota"])
+                # Copia nueva del item: las sesiones que están leyendo siguen viendo uno coherente
+                e["datos"][item_id] = {**viejo, "datos": fila, "estilos": estilos, "notas": notas}
+
+@st.cache_resource
+def get_almacen_hojas():
+    return AlmacenHojas(descargar_hoja_track, construir_indices, version_archivo, disco=get_instantaneas())
+
+def cargar_hoja_indexada(nombre_archivo, nombre_hoja, refrescar=False):
+    return get_almacen_hojas().obtener(nombre_archivo, nombre_hoja, refrescar)
+
+def cargar_datos_completos_hoja(nombre_archivo, nombre_hoja, refrescar=False):
+    entrada = cargar_hoja_indexada(nombre_archivo, nombre_hoja, refrescar)
+    return entrada["datos"] if entrada else None
+
+def servicio_drive():
+    # Un servicio por llamada: los objetos de googleapiclient no se pueden compartir entre hilos
+    creds_dict = dict(st.secrets["gcp_service_account"])
+    creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=['https://www.googleapis.com/auth/drive'])
+    return build('drive', 'v3', credentials=creds)
+
+def descargar_archivos_roster():
     try:
-        creds_dict = dict(st.secrets["gcp_service_account"])
-        creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=['https://www.googleapis.com/auth/drive'])
-        service = build('drive', 'v3', credentials=creds)
-        results = service.files().list(q="name contains 'Roster' and mimeType='application/vnd.google-apps.spreadsheet' and trashed=false", fields="files(id, name)", orderBy="name desc").execute()
+        service = servicio_drive()
+        results = llamar_google(service.files().list(q="name contains 'Roster' and mimeType='application/vnd.google-apps.spreadsheet' and trashed=false", fields="files(id, name)", orderBy="name desc").execute, tipo="drive", op="drive_list")
         return {f['name']: f['id'] for f in results.get('files', [])}
     except: return {}
 
-@st.cache_data(ttl=600)
-def cargar_config_prod():
+def descargar_config_prod():
     sh = conectar_flexible(ID_CONFIG_PROD)
     if not sh: return {}
     try:
-        datos = sh.sheet1.get_all_values()
+        datos = llamar_google(hojas_libro(sh)[0].get_all_values)
         config = {}
         for row in datos:
+            if row and row[0].strip().lower() == "tramo": continue  # cabecera (Tramo | Archivo | Backup)
             if len(row) >= 3 and row[0] and row[1]: 
                 tramo = row[0].strip()
                 archivo_principal = row[1].strip()
@@ -209,172 +747,487 @@ def cargar_config_prod():
         return config
     except: return {}
 
-@st.cache_data(ttl=600)
-def cargar_vehiculos_dict():
+def descargar_vehiculos_dict():
     sh = conectar_flexible(ID_VEHICULOS)
     if not sh: return {}
     try:
-        return {r[0]: (r[1] if len(r)>1 else "") for r in sh.sheet1.get_all_values() if r and r[0] and "veh" not in r[0].lower()}
+        return {r[0]: (r[1] if len(r)>1 else "") for r in llamar_google(hojas_libro(sh)[0].get_all_values) if r and r[0] and "veh" not in r[0].lower()}
     except: return {}
 
-def cargar_trabajadores(id_roster):
+def hoja_roster(sh):
+    pestanas = hojas_libro(sh)
+    return next((w for w in pestanas if w.title == "Roster"), pestanas[0])
+
+# Modelo del Roster compartido por todas las sesiones, uno por libro. Una sola descarga da
+# la cabecera de días, ID -> fila, la lista de trabajadores y la ocupación de cada día del mes.
+TTL_ROSTER = 600
+
+@st.cache_resource
+def get_modelos_roster():
+    return {}
+
+def modelo_roster(sh, refrescar=False):
+    cache = get_modelos_roster()
+    modelo = cache.get(sh.id)
+    if modelo and not refrescar and time.time() - modelo["t"] < TTL_ROSTER: return modelo
+    ws = hoja_roster(sh)
+    datos = llamar_google(ws.get_all_values)
+    dias, filas, trabajadores = {}, {}, []
+    for fila in datos[3:9]:  # cabecera E4:AX9
+        for j, v in enumerate(fila[4:50]): dias.setdefault(str(v), 5 + j)
+    for i, fila in enumerate(datos):
+        if fila and fila[0]: filas.setdefault(str(fila[0]).strip(), i + 1)
+    for i, fila in enumerate(datos[8:], start=9):
+        if len(fila) < 2: continue
+        uid, nom = str(fila[0]).strip(), str(fila[1]).strip()
+        if not uid or "id" in uid.lower(): continue
+        tipo = "OBRA"
+        if len(fila) > 2 and ("A" == str(fila[2]).upper() or "ALMACEN" in str(fila[2]).upper()): tipo = "ALMACEN"
+        trabajadores.append({"display": f"{uid} - {nom}", "tipo": tipo, "id": uid, "nombre_solo": nom, "fila": i})
+    modelo = {"t": time.time(), "ws": ws, "dias": dias, "filas": filas, "trabajadores": trabajadores, "valores": datos,
+              "ws_para": next((w for w in hojas_libro(sh) if w.title == "Paralizaciones"), None)}
+    cache[sh.id] = modelo
+    return modelo
+
+def marcar_roster(sh, celdas):
+    # Tras guardar un parte se parchea el modelo: los asignados dejan de salir disponibles sin recargar
+    modelo = get_modelos_roster().get(sh.id)
+    if not modelo: return
+    for fila, col, valor in celdas:
+        row = modelo["valores"][fila - 1]
+        if len(row) < col: row.extend([""] * (col - len(row)))
+        row[col - 1] = valor
+
+def cargar_trabajadores(id_roster, fecha=None, filtro="TODOS"):
     if not id_roster: return []
     sh = conectar_flexible(id_roster)
     if not sh: return []
-    try:
-        ws = sh.sheet1 if "Roster" not in [w.title for w in sh.worksheets()] else sh.worksheet("Roster")
-        datos = ws.get_all_values()
-        lista = []
-        col_dia = 14 
-        hoy_dia = str(datetime.now().day)
-        for r in range(3, 9):
-            if r < len(datos) and hoy_dia in datos[r]: 
-                col_dia = datos[r].index(hoy_dia); break
-        
-        for fila in datos[8:]:
-            if len(fila) < 2: continue
-            uid, nom = str(fila[0]).strip(), str(fila[1]).strip()
-            if not uid or "id" in uid.lower(): continue
-            if len(fila) > col_dia and fila[col_dia]: continue 
-            tipo = "OBRA"
-            if len(fila) > 2 and ("A" == str(fila[2]).upper() or "ALMACEN" in str(fila[2]).upper()): tipo = "ALMACEN"
-            lista.append({"display": f"{uid} - {nom}", "tipo": tipo, "id": uid, "nombre_solo": nom})
-        return lista
+    try: modelo = modelo_roster(sh)
     except: return []
+    fecha = fecha or datetime.now()
+    col_dia = modelo["dias"].get(str(fecha.day), 14)
+    # Los de un parte de ese día que aún espera en el diario tampoco están disponibles (offline, o hasta que se vuelque)
+    en_cola = {t['ID'] for p in get_diario().partes_pendientes(id_roster) if p['fecha'][:10] == fecha.strftime("%Y-%m-%d") for t in p['lista']}
+    lista = [t for t in modelo["trabajadores"] if t["id"] not in en_cola and not safe_val(modelo["valores"][t["fila"] - 1], col_dia)]
+    if filtro == "ALMACEN": return [t for t in lista if t['tipo'] == "ALMACEN"]
+    if filtro == "OBRA": return [t for t in lista if t['tipo'] != "ALMACEN"]
+    return lista
 
-@st.cache_data(ttl=600)
-def obtener_hojas_track_cached(nombre_archivo):
+def descargar_hojas_track(nombre_archivo):
     sh = conectar_flexible(nombre_archivo)
     if not sh: return None
-    try: return [ws.title for ws in sh.worksheets() if "HR TRACK" in ws.title.upper()]
+    try: return [ws.title for ws in hojas_libro(sh) if "HR TRACK" in ws.title.upper()]
     except: return []
 
+def sondear_versiones(ids):
+    # Sondeo barato de cambios: files.get(fields=modifiedTime,version) de todos los archivos en un batch HTTP de Drive
+    servicio, versiones, ids = servicio_drive(), {}, sorted(ids)
+    def anotar(_, respuesta, error):
+        if error is None: versiones[respuesta['id']] = (respuesta.get('version'), respuesta.get('modifiedTime'))
+    for i in range(0, len(ids), 100):
+        lote = servicio.new_batch_http_request(callback=anotar)
+        for file_id in ids[i:i + 100]: lote.add(servicio.files().get(fileId=file_id, fields="id,modifiedTime,version"))
+        llamar_google(lote.execute, tipo="drive", op="drive_batch_versiones")
+    return versiones
+
+def descargar_versiones():
+    # Archivos principales de todos los tramos de cargar_config_prod y los Roster con modelo en memoria
+    ids = set(get_modelos_roster())
+    for principal, _ in (cargar_config_prod() or {}).values():
+        sh = conectar_flexible(principal)
+        if sh: ids.add(sh.id)
+    try: versiones = sondear_versiones(ids)
+    except: return {}
+    # Roster cambiado (filas insertadas u ordenadas en la oficina): las posiciones ID -> fila ya no valen
+    for file_id in get_cache_handles().anotar_versiones(versiones): get_modelos_roster().pop(file_id, None)
+    return versiones
+
+# Datos de referencia con "stale-while-revalidate": el lector recibe siempre el último valor
+# bueno al instante y un hilo los recarga antes de que caduquen. Un fallo de carga (vacío)
+# nunca pisa el valor bueno anterior; se reintenta a los 30 s. Con disco, el arranque sirve la
+# instantánea y una recarga adopta la de otra réplica si aún está vigente (salvo los efímeros).
+class RefrescoFondo:
+    def __init__(self, hilos=6, margen=0.8, disco=None, efimeros=()):
+        self.margen, self.disco, self.efimeros = margen, disco, set(efimeros)
+        self.lock = threading.Lock()
+        self.valores = {}  # (nombre, args) -> {"valor", "t", "ttl", "cargar", "ok"}
+        self.futuros = {}  # (nombre, args) -> Future de la carga en curso
+        self.pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="refresco")
+
+    def _de_disco(self, clave):
+        if not self.disco or clave[0] in self.efimeros: return None
+        return self.disco.leer(("ref",) + clave)
+
+    def _cargar(self, clave, cargar, ttl):
+        snap = self._de_disco(clave)
+        if snap and snap["valor"] and time.time() - snap["t"] < ttl * self.margen:
+            valor, t = snap["valor"], snap["t"]  # otra réplica ya la recargó
+        else:
+            try: valor = cargar(*clave[1])
+            except Exception: valor = None
+            t = time.time()
+            if valor and self.disco and clave[0] not in self.efimeros: self.disco.guardar(("ref",) + clave, valor, t=t)
+        with self.lock:
+            self.futuros.pop(clave, None)
+            e = self.valores.get(clave)
+            if valor or e is None: self.valores[clave] = {"valor": valor, "t": t, "ttl": ttl, "cargar": cargar, "ok": bool(valor)}
+            else: e.update(t=time.time(), ok=False)
+            return self.valores[clave]["valor"]
+
+    def _lanzar(self, clave, cargar, ttl):
+        with self.lock:
+            fut = self.futuros.get(clave)
+            if fut is None: fut = self.futuros[clave] = self.pool.submit(self._cargar, clave, cargar, ttl)
+            return fut
+
+    def obtener(self, nombre, cargar, ttl, *args):
+        clave = (nombre, args)
+        with self.lock: e = self.valores.get(clave)
+        if e is None:
+            snap = self._de_disco(clave)
+            if not snap or not snap["valor"]: return self._lanzar(clave, cargar, ttl).result()  # arranque en frío o precarga en curso
+            with self.lock: e = self.valores.setdefault(clave, {"valor": snap["valor"], "t": snap["t"], "ttl": ttl, "cargar": cargar, "ok": True})
+            if time.time() - e["t"] > ttl * self.margen: self._lanzar(clave, cargar, ttl)
+        return e["valor"]
+
+    def parchear(self, nombre, cambiar, *args):
+        with self.lock:
+            e = self.valores.get((nombre, args))
+            if e and e["valor"] is not None: e["valor"] = cambiar(e["valor"])
+
+    def precargar(self, tareas):
+        return [self._lanzar((nombre, args), cargar, ttl) for nombre, cargar, ttl, args in tareas]
+
+    def arrancar(self):
+        threading.Thread(target=self._bucle, name="refresco-fondo", daemon=True).start()
+
+    def _bucle(self):
+        while True:
+            time.sleep(5)
+            ahora = time.time()
+            with self.lock:
+                vencen = [(c, e) for c, e in self.valores.items() if ahora - e["t"] > (e["ttl"] * self.margen if e["ok"] else 30)]
+            for clave, e in vencen: self._lanzar(clave, e["cargar"], e["ttl"])
+
+TTL_REFERENCIA = {"roster": 300, "config": 600, "vehiculos": 600, "hojas_track": 600, "versiones": 60}
+
+@st.cache_resource
+def get_refresco():
+    # Las versiones de Drive no se guardan: una vieja haría pasar por fresca una hoja vieja del disco
+    refresco = RefrescoFondo(disco=get_instantaneas(), efimeros={"versiones"})
+    # Arranque en frío: las tres cargas del sidebar en paralelo y, en cuanto llega la
+    # configuración, las pestañas HR TRACK de todos los tramos
+    refresco.precargar([("roster", descargar_archivos_roster, TTL_REFERENCIA["roster"], ()),
+                        ("config", descargar_config_prod, TTL_REFERENCIA["config"], ()),
+                        ("vehiculos", descargar_vehiculos_dict, TTL_REFERENCIA["vehiculos"], ())])
+    def hojas_de_tramos():
+        conf = refresco.obtener("config", descargar_config_prod, TTL_REFERENCIA["config"]) or {}
+        refresco.precargar([("hojas_track", descargar_hojas_track, TTL_REFERENCIA["hojas_track"], (principal,)) for principal, _ in conf.values()])
+        # El sondeo de versiones corre siempre, no solo cuando se abre PRODUCCIÓN: también vigila los Roster
+        refresco.precargar([("versiones", descargar_versiones, TTL_REFERENCIA["versiones"], ())])
+    refresco.pool.submit(hojas_de_tramos)
+    refresco.arrancar()
+    return refresco
+
+def buscar_archivos_roster(): return get_refresco().obtener("roster", descargar_archivos_roster, TTL_REFERENCIA["roster"])
+def cargar_config_prod(): return get_refresco().obtener("config", descargar_config_prod, TTL_REFERENCIA["config"])
+def cargar_vehiculos_dict(): return get_refresco().obtener("vehiculos", descargar_vehiculos_dict, TTL_REFERENCIA["vehiculos"])
+def obtener_hojas_track_cached(nombre_archivo): return get_refresco().obtener("hojas_track", descargar_hojas_track, TTL_REFERENCIA["hojas_track"], nombre_archivo)
+
+def version_archivo(nombre_archivo):
+    # Versión de Drive del último sondeo (None si no hay sondeo o el archivo no está en la configuración)
+    sh = conectar_flexible(nombre_archivo)
+    if not sh: return None
+    return (get_refresco().obtener("versiones", descargar_versiones, TTL_REFERENCIA["versiones"]) or {}).get(sh.id)
+
 # ==========================================
 #        GUARDADO Y PDF
 # ==========================================
-def guardar_parte(fecha, lista, vehiculo, para, id_roster):
+def guardar_parte(fecha, lista, vehiculo, para, id_roster, usuario="", ref="", reintento=False):
+    # Lo ejecuta el hilo del diario; el error sale tal cual para que el diario distinga permanente de reintentable
     sh = conectar_flexible(id_roster)
-    if not sh: return False
+    if not sh: raise Exception(f"No se pudo abrir el Roster {id_roster}")
+    hoja_nueva = False
     try:
-        ws = sh.sheet1 if "Roster" not in [w.title for w in sh.worksheets()] else sh.worksheet("Roster")
-        header = ws.range(f"E4:AX9")
-        c_idx = next((c.col for c in header if str(c.value) == str(fecha.day)), 14)
-        ids_col = ws.col_values(1)
-        upds = []
-        for t in lista:
-            try: 
-                r = ids_col.index(t['ID']) + 1
-                upds.append(gspread.Cell(r, c_idx, t['Turno_Letra']))
-                upds.append(gspread.Cell(r, c_idx+1, t['Total_Horas']))
-            except: pass
-        if upds: ws.update_cells(upds)
-        if para:
-            try: wp = sh.worksheet("Paralizaciones")
-            except: 
-                wp = sh.add_worksheet("Paralizaciones", 1000, 10)
-                wp.append_row(["Fecha", "Vehiculo/Lugar", "Inicio", "Fin", "Horas", "Motivo", "Usuario"])
-            wp.append_row([str(fecha.date()), vehiculo, para['inicio'], para['fin'], para['duracion'], para['motivo'], st.session_state.user_name])
-        return True
-    except: return False
+        modelo = modelo_roster(sh)
+        if any(t['ID'] not in modelo['filas'] for t in lista): modelo = modelo_roster(sh, refrescar=True)
+        c_idx = modelo['dias'].get(str(fecha.day), 14)
+        refs_previas = (lambda ws: llamar_google(ws.col_values, 8)) if reintento else None
+        peticiones, hoja_nueva = peticiones_parte(modelo, fecha, lista, vehiculo, para, usuario, ref, refs_previas)
+        if peticiones: llamar_google(sh.batch_update, {"requests": peticiones}, tipo="escritura")
+        if hoja_nueva:
+            invalidar_hojas(sh); get_modelos_roster().pop(sh.id, None)
+        else:
+            marcar_roster(sh, [(modelo['filas'][t['ID']], c_idx + k, v) for t in lista if t['ID'] in modelo['filas']
+                               for k, v in ((0, t['Turno_Letra']), (1, str(t['Total_Horas'])))])
+            anotar_escritura_propia(sh, id_roster)  # el modelo ya está parcheado: que el sondeo no lo tire
+    except Exception as e:
+        # El addSheet puede haber entrado aunque se perdiera la respuesta: sin invalidar, el reintento
+        # seguiría viendo la lista vieja de pestañas y chocaría con "already exists" hasta que venciera el TTL
+        invalidar_hojas(sh); get_modelos_roster().pop(sh.id, None)
+        # Ese 400 se arregla con la lista nueva de pestañas: no es permanente
+        if hoja_nueva and codigo_http(e) == 400: raise Exception(f"Paralizaciones ya creada, se reintenta: {e}") from e
+        raise
 
-def guardar_prod_con_nota_compleja(archivo_principal, hoja, fila, col, valor, vehiculo, archivo_backup, texto_extra="", estilo_letra=None):
-    exito_principal = False
+def nota_produccion(valor, vehiculo, texto_extra=""):
+    hora_act = datetime.now().strftime("%H:%M")
+    nota = f"📅 {valor} - {hora_act}\n🚛 {vehiculo}\n👷 {st.session_state.user_name}"
+    if texto_extra: nota += f"\n⚠️ {texto_extra}"
+    return nota
+
+def commit_prod(archivo_principal, celdas_por_hoja, archivo_backup):
+    # Lo ejecuta el hilo del diario. batchUpdate es atómico: o entran todas las celdas del archivo o ninguna
     sh = conectar_flexible(archivo_principal)
-    if not sh: return False
-    try:
-        ws = sh.worksheet(hoja)
-        ws.update_cell(fila, col, valor)
-        celda_a1 = rowcol_to_a1(fila, col)
-        hora_act = datetime.now().strftime("%H:%M")
-        nota = f"📅 {valor} - {hora_act}\n🚛 {vehiculo}\n👷 {st.session_state.user_name}"
-        if texto_extra: nota += f"\n⚠️ {texto_extra}"
-        ws.insert_note(celda_a1, nota)
-        if estilo_letra: cambiar_formato_google(ws, fila, col, estilo_letra)
-        else: cambiar_formato_google(ws, fila, col, "NORMAL")
-        exito_principal = True
+    if not sh: raise Exception(f"No se pudo abrir {archivo_principal}")
+    commit_celdas(sh, celdas_por_hoja)
+    for hoja, celdas in celdas_por_hoja.items():
+        # El backup no retiene el lote: lo replica el espejo en segundo plano
+        if archivo_backup and archivo_backup != "": get_espejo().encolar(archivo_backup, hoja, celdas)
+        # Solo se tocan las celdas escritas: las demás hojas y tramos siguen en caché para todos
+        get_almacen_hojas().parchear(archivo_principal, hoja, celdas)
+    anotar_escritura_propia(sh, archivo_principal)
+
+def anotar_escritura_propia(sh, archivo):
+    # Un files.get tras el commit: la versión nueva se da por vista, así el sondeo no toma la escritura
+    # propia por un cambio ajeno ni se vuelve a descargar una hoja que ya está parcheada en memoria
+    try: r = llamar_google(servicio_drive().files().get(fileId=sh.id, fields="version,modifiedTime").execute, tipo="drive", op="drive_version")
+    except Exception: return
+    nueva = (r.get('version'), r.get('modifiedTime'))
+    previa = get_cache_handles().adoptar_version(sh.id, nueva)
+    if previa is None: return
+    get_almacen_hojas().adoptar_version(archivo, previa, nueva)
+    get_refresco().parchear("versiones", lambda versiones: {**versiones, sh.id: nueva})
+
+def commit_backup(archivo_backup, celdas_por_hoja):
+    sh = conectar_flexible(archivo_backup)
+    if not sh: raise Exception(f"No se pudo abrir {archivo_backup}")
+    commit_celdas(sh, celdas_por_hoja)
+
+def guardar_celdas_prod(archivo_principal, hoja, celdas, archivo_backup):
+    # Devuelve el lote apuntado en el diario local; el envío a Google lo hace el hilo de fondo
+    try: return get_diario().encolar_celdas(archivo_principal, archivo_backup, hoja, celdas)
     except Exception as e:
-        st.error(f"❌ Error Principal: {e}")
-        return False
-        
-    if archivo_backup and archivo_backup != "":
-        try:
-            sh_bk = conectar_flexible(archivo_backup)
-            if sh_bk:
-                ws_bk = sh_bk.worksheet(hoja)
-                ws_bk.update_cell(fila, col, valor)
-                ws_bk.insert_note(rowcol_to_a1(fila, col), nota)
-                if estilo_letra: cambiar_formato_google(ws_bk, fila, col, estilo_letra)
-        except: pass
-    cargar_datos_completos_hoja.clear() 
-    return exito_principal
+        st.error(f"❌ Error Diario: {e}")
+        return None
 
-def generar_pdf(fecha, jefe, lista, para, prod):
-    b = BytesIO()
-    c = canvas.Canvas(b, pagesize=A4); _, h = A4
-    start_time, end_time = "________", "________"
-    if lista: start_time, end_time = lista[0]['H_Inicio'], lista[0]['H_Fin']
-    y = h - 90
-    c.setLineWidth(1); c.rect(40, y - 60, 515, 70) 
-    c.setFont("Helvetica-Bold", 16); c.drawString(50, h - 50, "Daily Work Log - SEMI ISRAEL")
-    c.setFont("Helvetica", 10); c.drawString(400, h - 50, "Israel Railways Project")
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(50, y - 15, f"Date: {fecha}"); c.drawString(250, y - 15, f"Vehicle / Location: {jefe}")
-    c.drawString(50, y - 45, f"Start Time: {start_time}"); c.drawString(200, y - 45, f"End Time: {end_time}")
-    c.drawString(350, y - 45, "Weather: ________")
-    y_cursor = y - 80
-    c.setFillColor(colors.HexColor("#2980B9")); c.rect(40, y_cursor, 515, 20, fill=1); c.setFillColor(colors.white)
-    c.setFont("Helvetica-Bold", 8)
-    headers = ["Employee Name", "ID Number", "Company", "Profession", "Normal", "Extra", "Night"]
-    x_coords = [40, 180, 260, 330, 400, 450, 500, 555]
-    for i, head in enumerate(headers): c.drawString(x_coords[i] + 5, y_cursor + 6, head)
-    y_cursor -= 20; c.setFillColor(colors.black); c.setFont("Helvetica", 9); y_tabla_start = y - 80
-    for t in lista:
-        h_base = 8.0 if t['Total_Horas'] > 8 else t['Total_Horas']
-        h_extra = t['Total_Horas'] - 8.0 if t['Total_Horas'] > 8 else 0.0
-        col_base = 6 if t['Es_Noche'] else 4
-        c.drawString(x_coords[0]+5, y_cursor+6, t['Nombre'][:25])
-        c.drawString(x_coords[1]+5, y_cursor+6, str(t['ID']))
-        c.drawString(x_coords[2]+5, y_cursor+6, "SEMI")
-        c.drawString(x_coords[3]+5, y_cursor+6, "Official")
-        c.drawString(x_coords[col_base]+10, y_cursor+6, f"{h_base:g}")
-        if h_extra > 0: c.drawString(x_coords[5]+10, y_cursor+6, f"{h_extra:g}")
-        c.setLineWidth(0.5); c.line(40, y_cursor, 555, y_cursor); y_cursor -= 20
-        if y_cursor < 200: c.showPage(); y_cursor = h - 50
-    y_min = h - 400
-    while y_cursor > y_min: c.setLineWidth(0.5); c.line(40, y_cursor, 555, y_cursor); y_cursor -= 20
-    c.setLineWidth(1)
-    y_final = y_cursor
-    for x in x_coords: c.line(x, y_tabla_start + 20, x, y_final - 0)
-    c.line(555, y_tabla_start + 20, 555, y_final - 0) 
-    y_bloque = y_final - 40
-    if para:
-        c.setStrokeColor(colors.red); c.setLineWidth(2); c.rect(40, y_bloque - 50, 515, 50)
-        c.setFillColor(colors.red); c.setFont("Helvetica-Bold", 10); c.drawString(50, y_bloque - 15, "⚠️ DELAY")
-        c.setFillColor(colors.black); c.setFont("Helvetica", 10); c.drawString(50, y_bloque - 35, f"{para['inicio']}-{para['fin']} | {para['motivo']}")
-        c.setStrokeColor(colors.black); c.setLineWidth(1); y_bloque -= 70
-    y_act = y_bloque; alt = y_act - 130
-    if alt > 20:
-        c.rect(40, 130, 515, alt); c.setFont("Helvetica-Bold", 10); c.drawString(50, y_act - 15, "Production:")
-        yl = y_act - 35
-        if prod:
-            c.setFont("Helvetica", 9)
-            for k,v in prod.items(): c.drawString(50, yl+5, f"- {k}: {','.join(v)}"); c.line(40, yl, 555, yl); yl-=20
-        while yl > 135: c.line(40, yl, 555, yl); yl-=20
-    c.setLineWidth(1); c.rect(40, 30, 515, 90); c.setFont("Helvetica-Bold", 10)
-    c.drawString(50, 100, "Machinery / Materials:"); c.line(40, 70, 555, 70)
-    c.drawString(50, 50, "SIGNATURE (ENCARGADO): __________________________")
-    c.save(); b.seek(0); return b
-
-def enviar_email(pdf, nombre, fecha, jefe):
+def guardar_prod_con_nota_compleja(archivo_principal, hoja, fila, col, valor, vehiculo, archivo_backup, texto_extra="", estilo_letra=None):
+    nota = nota_produccion(valor, vehiculo, texto_extra)
+    celda = {"fila": fila, "col": col, "valor": valor, "nota": nota, "estilo": estilo_letra}
+    return guardar_celdas_prod(archivo_principal, hoja, [celda], archivo_backup)
+
+# El PDF se genera en un pool: el parte se encola mientras se dibuja
+@st.cache_resource
+def get_pool_pdf():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf")
+
+def pdf_y_email(bandeja, asunto, nombre, *args):
+    # En el pool: dibuja el parte y lo deja en la bandeja de salida (la entrega el hilo "correo"),
+    # aunque la sesión ya no esté para verlo. Devuelve (pdf, aviso del correo)
+    pdf = generar_pdf(*args)
+    if bandeja is None: return pdf, ""
     try:
-        if "email" not in st.secrets: return False
-        u, p, d = st.secrets["email"]["usuario"], st.secrets["email"]["password"], st.secrets["email"]["destinatario"]
-        msg = MIMEMultipart(); msg['Subject']=f"Parte {fecha} {jefe}"; msg['From']=u; msg['To']=d
-        att = MIMEBase('application','octet-stream'); att.set_payload(pdf.getvalue()); encoders.encode_base64(att)
-        att.add_header('Content-Disposition',f"attachment; filename={nombre}"); msg.attach(att)
-        s = smtplib.SMTP('smtp.gmail.com',587); s.starttls(); s.login(u,p); s.sendmail(u,d,msg.as_string()); s.quit()
-        return True
-    except: return False
+        bandeja.encolar(asunto, nombre, pdf.getvalue())
+        return pdf, "📧 Email en cola"
+    except Exception: return pdf, "⚠️ Error Email"
+
+# Mientras el pool dibuja el PDF de un parte ya guardado, solo este fragmento se repite cada segundo;
+# al terminar recarga la página, que ofrece la descarga
+@st.fragment(run_every=1)
+def esperar_pdf_parte():
+    if st.session_state.parte_pdf and st.session_state.parte_pdf["futuro"].done(): st.rerun()
+    st.info("✅ Guardado. Generando PDF...")
+
+# ==========================================
+#     PARTES EN LOTE (FIN DE MES)
+# ==========================================
+# Rehace los partes de un rango de días a partir del Roster: una lectura de la rejilla, otra de
+# las notas de esas columnas (vehículo y horario que deja guardar_parte) y otra de Paralizaciones.
+# Se agrupan por (día, vehículo) y los PDF se dibujan en un pool de procesos.
+PATRON_HORARIO = re.compile(r"🕒\s*(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})")
+
+def leer_partes_roster(id_roster, desde, hasta):
+    sh = conectar_flexible(id_roster)
+    if not sh: raise Exception("No se pudo abrir el Roster")
+    modelo = modelo_roster(sh, refrescar=True)
+    dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    cols = {d: modelo["dias"][str(d.day)] for d in dias if str(d.day) in modelo["dias"]}
+    if not cols: return {}
+    rango = f"'{modelo['ws'].title}'!{letra_col(min(cols.values()))}:{letra_col(max(cols.values()))}"
+    res = llamar_google(sh.fetch_sheet_metadata, params={'includeGridData': True, 'ranges': [rango],
+                        'fields': "sheets(data(startRow,startColumn,rowData(values(note))))"}, op="roster_notas")
+    notas = {}
+    for bloque in res['sheets'][0].get('data', []):
+        col0, fila0 = bloque.get('startColumn', 0) + 1, bloque.get('startRow', 0) + 1
+        for i, fila in enumerate(bloque.get('rowData', [])):
+            for j, celda in enumerate(fila.get('values', [])):
+                if celda.get('note'): notas[(fila0 + i, col0 + j)] = celda['note']
+    partes = {}
+    for d, col in cols.items():
+        for t in modelo["trabajadores"]:
+            fila = modelo["valores"][t["fila"] - 1]
+            letra = str(safe_val(fila, col) or "").strip().upper()
+            if letra not in ("D", "N"): continue  # vacaciones, bajas y demás letras a mano no son parte
+            nota = notas.get((t["fila"], col), "")
+            horario = PATRON_HORARIO.search(nota)
+            try: horas = float(str(safe_val(fila, col + 1)).replace(",", "."))
+            except (TypeError, ValueError): horas = 0.0
+            vehiculo = (parsear_nota(nota)["vehiculo"] if nota else "") or "SIN VEHÍCULO"
+            partes.setdefault((d, vehiculo), {"lista": [], "para": None})["lista"].append({
+                "ID": t["id"], "Nombre": t["nombre_solo"], "Total_Horas": horas, "Turno_Letra": letra,
+                "H_Inicio": horario.group(1) if horario else "", "H_Fin": horario.group(2) if horario else "", "Es_Noche": letra == "N"})
+    if modelo["ws_para"] is not None:
+        for f in llamar_google(modelo["ws_para"].get_all_values)[1:]:
+            try: d = datetime.fromisoformat(f[0])
+            except (ValueError, IndexError): continue
+            if not (desde <= d <= hasta) or len(f) < 6: continue
+            p = partes.setdefault((d, f[1] or "SIN VEHÍCULO"), {"lista": [], "para": None})
+            if p["para"] is None: p["para"] = {"inicio": f[2], "fin": f[3], "duracion": f[4], "motivo": f[5]}
+            else: p["para"].update(fin=f[3], motivo=f"{p['para']['motivo']}; {f[5]}")  # varias paradas el mismo día
+    return partes
+
+def generar_partes_lote(id_roster, desde, hasta, procesos=4):
+    partes = leer_partes_roster(id_roster, desde, hasta)
+    trabajos = [(str(d.date()), vehiculo, p["lista"], p["para"], {}) for (d, vehiculo), p in sorted(partes.items())]
+    # spawn: los procesos solo importan partes_pdf, no heredan los hilos ni el estado de Streamlit
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pdfs = list(pool.map(pdf_bytes, trabajos, chunksize=8))
+    b = BytesIO()
+    with zipfile.ZipFile(b, "w", zipfile.ZIP_DEFLATED) as z:
+        for (fecha, vehiculo, *_), pdf in zip(trabajos, pdfs):
+            nombre = re.sub(r"[^\w.-]+", "_", vehiculo)
+            z.writestr(f"Parte_{fecha}_{nombre}.pdf", pdf)
+    b.seek(0)
+    return b, len(trabajos)
+
+# ==========================================
+#     ESPEJO DEL ARCHIVO BACKUP (EN SEGUNDO PLANO)
+# ==========================================
+# Junta las celdas pendientes de cada backup y las vuelca en un solo batchUpdate por archivo.
+# Un archivo nunca tiene dos volcados a la vez, así se conserva el orden de las escrituras.
+# La cola vive en memoria (el original ya está confirmado en el diario): se pierde al reiniciar.
+# Si el envío conjunto falla por una hoja concreta, cada hoja va por su cuenta; la que sigue fallando
+# tras MAX_INTENTOS_ESPEJO (o con un error que no se arregla reintentando) pasa a descartadas.
+MAX_INTENTOS_ESPEJO = 8  # esperas de 2, 4, ... 120 s: unos 4 minutos
+
+class EspejoBackup:
+    def __init__(self, aplicar, hilos=4):
+        self.aplicar = aplicar  # (archivo_backup, {hoja: celdas}), lanza excepción si falla
+        self.pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="espejo-backup")
+        self.lock = threading.Lock()
+        self.cola = {}  # archivo -> [(t_encolado, hoja, celda)]
+        self.en_curso = set()
+        self.enviadas, self.fallos, self.ultimo_error = 0, 0, ""
+        self.descartadas, self.n_descartadas = deque(maxlen=500), 0  # (t, archivo, hoja, celda, error)
+
+    def encolar(self, archivo, hoja, celdas):
+        with self.lock:
+            self.cola.setdefault(archivo, []).extend((time.time(), hoja, c) for c in celdas)
+            if archivo in self.en_curso: return
+            self.en_curso.add(archivo)
+        self.pool.submit(self._volcar, archivo)
+
+    def _aplicar(self, archivo, por_hoja):
+        self.aplicar(archivo, {hoja: [c for _, _, c in ops] for hoja, ops in por_hoja.items()})
+
+    def _volcar(self, archivo):
+        errores = {}  # hoja -> fallos seguidos
+        while True:
+            with self.lock:
+                ops = list(self.cola.get(archivo, []))
+                if not ops:
+                    self.cola.pop(archivo, None); self.en_curso.discard(archivo); return
+            por_hoja = {}
+            for op in ops: por_hoja.setdefault(op[1], []).append(op)
+            fallidas = {}
+            try: self._aplicar(archivo, por_hoja)
+            except Exception as e:
+                if len(por_hoja) == 1 or not error_permanente(e): fallidas = {hoja: e for hoja in por_hoja}
+                else:
+                    for hoja, ops_hoja in por_hoja.items():
+                        try: self._aplicar(archivo, {hoja: ops_hoja})
+                        except Exception as e_hoja: fallidas[hoja] = e_hoja
+            hechas = [op for hoja, ops_hoja in por_hoja.items() if hoja not in fallidas for op in ops_hoja]
+            descartar = []
+            for hoja in por_hoja:
+                if hoja not in fallidas: errores.pop(hoja, None); continue
+                errores[hoja] = MAX_INTENTOS_ESPEJO if error_permanente(fallidas[hoja]) else errores.get(hoja, 0) + 1
+                if errores[hoja] >= MAX_INTENTOS_ESPEJO: descartar.append(hoja); errores.pop(hoja)
+            with self.lock:
+                quitar = {id(op) for op in hechas}
+                for hoja in descartar:
+                    quitar.update(id(op) for op in por_hoja[hoja])
+                    self.descartadas.extend((t, archivo, hoja, c, str(fallidas[hoja])) for t, _, c in por_hoja[hoja])
+                    self.n_descartadas += len(por_hoja[hoja])
+                self.cola[archivo] = [op for op in self.cola[archivo] if id(op) not in quitar]
+                self.enviadas += len(hechas)
+                if fallidas:
+                    hoja, e = next(iter(fallidas.items()))
+                    self.fallos += 1; self.ultimo_error = f"{archivo}/{hoja}: {e}"
+            if errores: time.sleep(min(120, 2 ** max(errores.values())))
+
+    def estado(self):
+        with self.lock:
+            pendientes = sum(len(ops) for ops in self.cola.values())
+            antiguo = min((ops[0][0] for ops in self.cola.values() if ops), default=None)
+            return {"pendientes": pendientes, "retraso_s": time.time() - antiguo if antiguo else 0.0,
+                    "enviadas": self.enviadas, "fallos": self.fallos, "ultimo_error": self.ultimo_error,
+                    "descartadas": self.n_descartadas}
+
+    def ultimas_descartadas(self):
+        with self.lock: return [(t, archivo, hoja, c['fila'], c['col'], c['valor'], error) for t, archivo, hoja, c, error in self.descartadas]
+
+@st.cache_resource
+def get_espejo():
+    return EspejoBackup(commit_backup)
+
+def replay_parte(payload, reintento):
+    guardar_parte(datetime.fromisoformat(payload['fecha']), payload['lista'], payload['vehiculo'], payload['para'],
+                  payload['id_roster'], payload['usuario'], payload['ref'], reintento)
+
+@st.cache_resource
+def get_diario():
+    diario = DiarioEscrituras(RUTA_DIARIO, commit_prod, replay_parte)
+    diario.arrancar()
+    return diario
+
+def encolar_parte(fecha, lista, vehiculo, para, id_roster):
+    ref = uuid.uuid4().hex[:12]
+    payload = {"fecha": fecha.isoformat(), "lista": lista, "vehiculo": vehiculo, "para": para,
+               "id_roster": id_roster, "usuario": st.session_state.user_name, "ref": ref}
+    try: return get_diario().encolar_parte(id_roster, payload)
+    except Exception as e:
+        st.error(f"❌ Error Diario: {e}")
+        return None
+
+def esperar_lote(lote, timeout=20):
+    # Sondea el diario local (sin red) hasta que Google confirme el lote o venza el plazo
+    limite = time.time() + timeout
+    while time.time() < limite:
+        estado = get_diario().estado_lote(lote)
+        if estado != "PENDIENTE": return estado
+        time.sleep(0.3)
+    return "PENDIENTE"
+
+# ==========================================
+#     BANDEJA DE SALIDA DE CORREO (EN SEGUNDO PLANO)
+# ==========================================
+def config_correo():
+    # host/puerto/tls opcionales en [email] para probar contra un SMTP local (p. ej. aiosmtpd)
+    e = st.secrets["email"]
+    return {"host": e.get("host", "smtp.gmail.com"), "puerto": int(e.get("puerto", 587)),
+            "tls": str(e.get("tls", True)).lower() not in ("false", "0", "no"),
+            "usuario": e.get("usuario", ""), "password": e.get("password", ""), "destinatario": e["destinatario"]}
+
+# Entrega, reintentos y conexión SMTP: ver correo.py
+@st.cache_resource
+def get_bandeja():
+    bandeja = BandejaCorreo(RUTA_DIARIO, config_correo, get_metricas())
+    bandeja.arrancar()
+    return bandeja
+
+# Cronómetro del rerun; las llamadas se atribuyen a la página/pestaña que se está pintando
+metricas = get_metricas()
+metricas.inicio_rerun(st.session_state.current_page)
 
 # ==========================================
 #     BARRA LATERAL: TRAMO Y VEHÍCULO
@@ -382,6 +1235,18 @@ def enviar_email(pdf, nombre, fecha, jefe):
 with st.sidebar:
     st.image("https://cdn-icons-png.flaticon.com/512/2942/2942813.png", width=100)
     st.write(f"👤 **{st.session_state.user_name}**")
+    diario = get_diario()
+    n_pend, n_fallo = diario.pendientes(), diario.fallidas()
+    if n_pend: st.warning(f"⏳ {n_pend} escrituras pendientes de envío")
+    if n_fallo: st.error(f"⚠️ {n_fallo} escrituras fallidas")
+    est_bk = get_espejo().estado()
+    if est_bk["pendientes"] or est_bk["fallos"]:
+        st.caption(f"🪞 Backup: {est_bk['pendientes']} pendientes · retraso {est_bk['retraso_s']:.0f}s · {est_bk['fallos']} fallos (cola en memoria: se pierde al reiniciar)")
+    if est_bk["descartadas"]: st.error(f"🪞 {est_bk['descartadas']} escrituras del backup descartadas (ver ?admin=1)")
+    if "email" in st.secrets:
+        bandeja = get_bandeja()
+        c_pend, c_fallo = bandeja.pendientes(), bandeja.fallidos()
+        if c_pend or c_fallo: st.caption(f"📧 Correo: {c_pend} en cola · {c_fallo} fallidos")
     
     if st.button("🏠 INICIO"):
         ir_a_home()
@@ -423,12 +1288,343 @@ with st.sidebar:
             st.info(f"Vehículo: {ve_sel}")
     else: st.error("No hay Vehículos")
 
+# ==========================================
+#     BUSCADOR DE PERFILES
+# ==========================================
+# Búsqueda en el servidor con los índices de la hoja: el navegador solo recibe una página
+# de resultados por rerun, no los miles de perfiles de la hoja.
+TAM_PAGINA_PERFILES = 50
+
+def mover_pagina(clave_pag, paso): st.session_state[clave_pag]["pag"] += paso
+
+def selector_perfil(etiqueta, indices, clave, candidatos=None, actual=None):
+    # Sin 'actual' se mantiene el último perfil elegido en este selector
+    if actual is None: actual = st.session_state.get(f"{clave}_sel")
+    consulta = st.text_input(f"🔎 Buscar ({etiqueta.rstrip(':')})", key=f"{clave}_q", placeholder="ID de perfil o nombre de poste")
+    resultados = buscar_perfiles(indices, consulta, candidatos)
+    if not resultados:
+        st.warning("Sin resultados"); return None
+    # Búsqueda nueva: se abre en la página del perfil actual, o en la primera (mejores resultados)
+    clave_pag, firma = f"{clave}_pag", (consulta, len(resultados), actual)
+    estado = st.session_state.setdefault(clave_pag, {"firma": None, "pag": 0})
+    if estado["firma"] != firma:
+        estado["firma"], estado["pag"] = firma, (resultados.index(actual) if actual in resultados else 0) // TAM_PAGINA_PERFILES
+    n_pag = -(-len(resultados) // TAM_PAGINA_PERFILES)
+    pag = estado["pag"] = max(0, min(estado["pag"], n_pag - 1))
+    opciones = resultados[pag * TAM_PAGINA_PERFILES:(pag + 1) * TAM_PAGINA_PERFILES]
+    sel = st.selectbox(etiqueta, opciones, index=opciones.index(actual) if actual in opciones else 0)
+    if n_pag > 1:
+        c_ant, c_txt, c_sig = st.columns([1, 3, 1])
+        c_ant.button("◀", key=f"{clave}_ant", disabled=pag == 0, on_click=mover_pagina, args=(clave_pag, -1), use_container_width=True)
+        c_txt.caption(f"Página {pag + 1}/{n_pag} · {len(resultados)} perfiles")
+        c_sig.button("▶", key=f"{clave}_sig", disabled=pag == n_pag - 1, on_click=mover_pagina, args=(clave_pag, 1), use_container_width=True)
+    st.session_state[f"{clave}_sel"] = sel
+    return sel
+
+# ==========================================
+#     PESTAÑAS DE PRODUCCIÓN (FRAGMENTOS)
+# ==========================================
+# Cada pestaña es un st.fragment: sus widgets (Giros, selectores de tramo, destinatario...) re-ejecutan solo
+# esa pestaña, no la barra lateral ni la carga de la hoja. Un st.rerun() dentro sigue recargando la página.
+def pestana_produccion(origen):
+    def decorador(fn):
+        @wraps(fn)
+        def envuelta(*args, **kwargs):
+            with get_metricas().fragmento(origen): return fn(*args, **kwargs)
+        return st.fragment(envuelta)
+    return decorador
+
+@pestana_produccion("PRODUCCION/RESUMEN")
+def pestana_resumen(it, info):
+    d = info['datos']
+    nombre_poste = safe_val(d, COL_POSTE)
+    st.markdown(f"### 📋 Perfil: {it} (Poste {nombre_poste})")
+    st.markdown("---")
+    f_cim_res = safe_val(d, COL_CIM_FECHA)
+    f_pos_res = safe_val(d, COL_POSTE_FECHA)
+    f_men_res = safe_val(d, COL_MENSULA_FECHA)
+    # Nota ya parseada al cargar la hoja: el resumen se pinta sin red
+    nota_tendido = info['notas'].get(COL_TENDIDO)
+    if not nota_tendido: info_tramo = ""
+    elif nota_tendido['tramo']: info_tramo = " -> ".join(nota_tendido['tramo'])
+    else: info_tramo = nota_tendido['texto']
+
+    cr1, cr2 = st.columns(2)
+    with cr1:
+        if f_cim_res: st.success(f"🧱 Cim: ✅ {f_cim_res}")
+        else: st.error("🧱 Cim: ❌")
+        if f_pos_res:
+            # Del estilo guardado en la hoja, no de los checkboxes: esos solo repintan la pestaña Postes
+            if info['estilos'].get(COL_POSTE_FECHA, "NORMAL") != "NORMAL":
+                st.warning(f"🗼 Poste: ⚠️ {f_pos_res}")
+            else: st.success(f"🗼 Poste: ✅ {f_pos_res}")
+        else: st.error("🗼 Poste: ❌")
+    with cr2:
+        if f_men_res: st.success(f"🔧 Mén: ✅ {f_men_res}")
+        else: st.error("🔧 Mén: ❌")
+        est_ten = st.session_state.get("estado_tendido_actual", "NORMAL")
+        if est_ten == "TENDIDO_AZUL": st.info(f"⚡ Cable: 🔵 TENDIDO\n\n📍 {info_tramo}")
+        elif est_ten == "GRAPADO_VERDE": st.success(f"⚡ Cable: ✅ GRAPADO\n\n📍 {info_tramo}")
+        else: st.error("⚡ Cable: ❌ PENDIENTE")
+
+@pestana_produccion("PRODUCCION/CIMENTACION")
+def pestana_cimentacion(nom, hj, bk, it, info):
+    fr, d = info['fila_excel'], info['datos']
+    pend = get_diario().celdas_pendientes(nom, hj)  # se relee en cada rerun del fragmento
+    st.subheader("Fase de Obra Civil")
+    c1, c2 = st.columns([1, 2])
+    ec, fc = safe_val(d, COL_CIM), safe_val(d, COL_CIM_FECHA)
+    c1.info(f"Tipo: {ec}")
+    if fc: c2.success(f"✅ Ejecutado el: {fc}")
+    elif (fr, COL_CIM_FECHA) in pend: c2.info("⏳ En cola de envío")
+    elif c2.button("Grabar CIMENTACIÓN", use_container_width=True):
+        guardar_prod_con_nota_compleja(nom, hj, fr, COL_CIM_FECHA, datetime.now().strftime("%d/%m/%Y"), st.session_state.veh_glob, bk)
+        if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
+        st.session_state.prod_dia[it].append("CIM"); st.rerun()
+
+@pestana_produccion("PRODUCCION/POSTES_ANCLAJES")
+def pestana_postes_anclajes(nom, hj, bk, it, info):
+    fr, d = info['fila_excel'], info['datos']
+    pend = get_diario().celdas_pendientes(nom, hj)  # se relee en cada rerun del fragmento
+    st.subheader("1. Estructura (Poste)")
+    c1, c2 = st.columns([1, 2])
+    ep, fp = safe_val(d, COL_POSTE), safe_val(d, COL_POSTE_FECHA)
+    c1.info(f"Tipo: {ep}")
+    if st.session_state.chk_comp and fp:
+        c2.success(f"✅ TERMINADO: {fp}")
+    elif (fr, COL_POSTE_FECHA) in pend: c2.info("⏳ En cola de envío")
+    else:
+        with c2:
+            cc1, cc2, cc3 = st.columns(3)
+            st.session_state.chk_giros = cc1.checkbox("Giros", value=st.session_state.chk_giros)
+            st.session_state.chk_aisl = cc2.checkbox("Aisladores", value=st.session_state.chk_aisl)
+            st.session_state.chk_comp = cc3.checkbox("Completo", value=st.session_state.chk_comp, on_change=on_completo_change)
+            if st.button("💾 Grabar POSTE", use_container_width=True):
+                txt = ""; estilo = "NORMAL"
+                if not st.session_state.chk_giros: txt += "GIROS FALTAN. "; estilo = "GIROS"
+                if not st.session_state.chk_aisl: txt += "AISLADORES FALTAN. "; estilo = "AISLADORES"
+                if st.session_state.chk_comp: estilo = "NORMAL"
+                guardar_prod_con_nota_compleja(nom, hj, fr, COL_POSTE_FECHA, datetime.now().strftime("%d/%m/%Y"), st.session_state.veh_glob, bk, txt, estilo_letra=estilo)
+                if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
+                st.session_state.prod_dia[it].append("POSTE"); st.rerun()
+
+    st.divider(); st.subheader("2. Anclajes")
+    cols_t, cols_f = COLS_ANCLAJE, COLS_ANCLAJE_FECHA
+    typs, cols_escritura, done = [], [], False
+    for i in range(4):
+        v = safe_val(d, cols_t[i])
+        if v:
+            typs.append(str(v)); cols_escritura.append(cols_f[i])
+            if safe_val(d, cols_f[i]): done = True
+    c1, c2 = st.columns([1, 2])
+    c1.info(f"Tipos: {', '.join(typs) if typs else 'Ninguno'}")
+    if not typs: c2.write("-")
+    elif done: c2.success("✅ Completos")
+    elif any((fr, c_idx) in pend for c_idx in cols_escritura): c2.info("⏳ En cola de envío")
+    elif c2.button("Grabar ANCLAJES", use_container_width=True):
+        hoy = datetime.now().strftime("%d/%m/%Y")
+        nota = nota_produccion(hoy, st.session_state.veh_glob)
+        guardar_celdas_prod(nom, hj, [{"fila": fr, "col": c_idx, "valor": hoy, "nota": nota} for c_idx in cols_escritura], bk)
+        if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
+        st.session_state.prod_dia[it].append("ANC"); st.rerun()
+
+@pestana_produccion("PRODUCCION/MENSULAS")
+def pestana_mensulas(nom, hj, bk, it, info):
+    fr, d = info['fila_excel'], info['datos']
+    pend = get_diario().celdas_pendientes(nom, hj)  # se relee en cada rerun del fragmento
+    st.subheader("Equipamiento: Ménsulas")
+    c1, c2 = st.columns([1, 2])
+    m_desc = " ".join(safe_val(d, c) or '' for c in COLS_MENSULA).strip()
+    fm = safe_val(d, COL_MENSULA_FECHA)
+    c1.info(f"Tipo: {m_desc or '-'}")
+    if fm: c2.success(f"Hecho: {fm}")
+    elif (fr, COL_MENSULA_FECHA) in pend: c2.info("⏳ En cola de envío")
+    elif c2.button("Grabar MÉNSULA", use_container_width=True):
+        guardar_prod_con_nota_compleja(nom, hj, fr, COL_MENSULA_FECHA, datetime.now().strftime("%d/%m/%Y"), st.session_state.veh_glob, bk)
+        if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
+        st.session_state.prod_dia[it].append("MEN"); st.rerun()
+
+@pestana_produccion("PRODUCCION/TENDIDOS")
+def pestana_tendidos(nom, hj, bk, it, datos_completos, indices):
+    d = datos_completos[it]['datos']
+    list_perfiles_ordenada, pos_perfil = indices["orden"], indices["pos"]
+    st.subheader("⚡ Tendido Cable LA-280")
+    f_la280 = safe_val(d, COL_TENDIDO)
+    est_ten = st.session_state.get("estado_tendido_actual", "NORMAL")
+    c1, c2 = st.columns([1,2])
+    if est_ten == "TENDIDO_AZUL": c1.info("Estado:"); c2.info("🔵 TENDIDO (Falta Grapar)")
+    elif est_ten == "GRAPADO_VERDE": c1.success("Estado:"); c2.success("✅ GRAPADO (Finalizado)")
+    else: c1.warning("Estado:"); c2.error("❌ PENDIENTE")
+
+    st.divider()
+    st.write("### 🛤️ Gestión de Tramos")
+    idx_def = 0
+    if it in pos_perfil: idx_def = pos_perfil[it]
+    idx_ini = idx_fin = idx_def
+    txt_rango = st.text_input("Rango por PK (ej. 34+200-35+100)", key=f"pk_{it}")
+    rango = rango_pk(txt_rango) if txt_rango else None
+    if rango and indices["pk_metros"]:
+        idx_ini = pos_perfil[perfil_mas_cercano(indices, rango[0])]
+        idx_fin = pos_perfil[perfil_mas_cercano(indices, rango[1])]
+    col_sel1, col_sel2 = st.columns(2)
+
+    # Mismo buscador paginado que el selector principal; las claves se reinician al cambiar de perfil o de rango
+    with col_sel1: p_ini = selector_perfil("Desde Perfil:", indices, f"s_ini_{it}_{txt_rango}", actual=list_perfiles_ordenada[idx_ini])
+    with col_sel2: p_fin = selector_perfil("Hasta Perfil:", indices, f"s_fin_{it}_{txt_rango}", actual=list_perfiles_ordenada[idx_fin])
+    if not (p_ini and p_fin): return
+    i_a, i_b = sorted((pos_perfil[p_ini], pos_perfil[p_fin]))
+    estados_tramo = [datos_completos[p]['estilos'].get(COL_TENDIDO, "NORMAL") for p in list_perfiles_ordenada[i_a : i_b + 1]]
+    n_azul, n_verde = estados_tramo.count("TENDIDO_AZUL"), estados_tramo.count("GRAPADO_VERDE")
+    st.caption(f"Estado del tramo: 🔵 {n_azul} tendidos · ✅ {n_verde} grapados · ❌ {len(estados_tramo) - n_azul - n_verde} pendientes")
+    # Como en las otras pestañas: mientras el diario tenga celdas del tramo sin enviar no se graba encima
+    pend = get_diario().celdas_pendientes(nom, hj)
+    en_cola = any((datos_completos[p]['fila_excel'], COL_TENDIDO) in pend for p in list_perfiles_ordenada[i_a : i_b + 1])
+    if en_cola: st.info("⏳ Hay celdas de este tramo en cola de envío")
+
+    fecha_tendido = datetime.now().strftime("%d/%m/%Y")
+    cb1, cb2 = st.columns(2)
+    btn_t = cb1.button("🚀 TENDIDO (Azul)", use_container_width=True, disabled=en_cola)
+    btn_g = cb2.button("✅ GRAPADO (Verde)", use_container_width=True, disabled=en_cola)
+
+    if btn_t or btn_g:
+        try:
+            idx_a, idx_b = pos_perfil[p_ini], pos_perfil[p_fin]
+            if idx_a > idx_b: idx_a, idx_b = idx_b, idx_a
+            perfiles_rango = list_perfiles_ordenada[idx_a : idx_b + 1]
+            total_p = len(perfiles_rango)
+            if btn_t: estilo_uso = "TENDIDO_AZUL"; accion_txt = "TENDIDO"
+            else: estilo_uso = "GRAPADO_VERDE"; accion_txt = "GRAPADO"
+            st.write(f"⏳ Procesando {total_p} perfiles...")
+            barra = st.progress(0)
+            celdas_tramo = []
+            for i, perfil_id in enumerate(perfiles_rango):
+                if perfil_id in datos_completos:
+                    es_extremo = (i == 0) or (i == total_p - 1)
+                    valor_a_escribir = fecha_tendido if es_extremo else ""
+                    celdas_tramo.append({
+                        "fila": datos_completos[perfil_id]['fila_excel'], "col": COL_TENDIDO, "valor": valor_a_escribir,
+                        "nota": nota_produccion(valor_a_escribir, st.session_state.veh_glob, f"Tramo: {p_ini} -> {p_fin}"),
+                        "estilo": estilo_uso
+                    })
+            # Todo el tramo en un único lote del diario (un batchUpdate por archivo): se aplica entero o nada
+            lote = guardar_celdas_prod(nom, hj, celdas_tramo, bk)
+            if lote:
+                barra.progress(0.3, text="📥 Tramo apuntado en el diario local")
+                estado_lote = esperar_lote(lote)
+                if estado_lote == "HECHO":
+                    barra.progress(1.0, text="✅ Confirmado por Google")
+                    st.success(f"✅ {accion_txt} registrado.")
+                elif estado_lote == "FALLIDO": st.error("❌ Google rechazó el tramo.")
+                else: st.warning(f"📶 {accion_txt} en cola: se enviará entero en cuanto haya cobertura.")
+                if estado_lote != "FALLIDO":
+                    time.sleep(2)
+                    if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
+                    st.session_state.prod_dia[it].append(f"{accion_txt} ({p_ini}-{p_fin})"); st.rerun()
+        except Exception as e: st.error(f"Error: {e}")
+
+@pestana_produccion("PRODUCCION/WHATSAPP")
+def pestana_whatsapp():
+    st.subheader("🔒 Red de Comunicación Interna")
+    st.info("Sistema protegido. Solo se permite comunicación con dispositivos autorizados.")
+    agenda_segura = {
+        "Tablet 01 (Cimentación)": "972500000001", "Tablet 02 (Postes)": "972500000002",
+        "Tablet 03 (Tendidos)": "972500000003", "Jefe de Obra (Emergencia)": "972500000000",
+        "Oficina Técnica": "972500000099"
+    }
+    col_dest, col_info = st.columns([2, 1])
+    with col_dest:
+        destinatario = st.selectbox(" Seleccionar Destinatario:", list(agenda_segura.keys()))
+        numero_destino = agenda_segura[destinatario]
+    with col_info: st.success(f"📡 Conectado con:\n**{destinatario}**")
+    st.markdown("---")
+    if 'mensaje_base' not in st.session_state:
+        resumen_prod = ""
+        if st.session_state.prod_dia:
+            for k, v in st.session_state.prod_dia.items(): resumen_prod += f"\n- {k}: {', '.join(v)}"
+        else: resumen_prod = "\n(Sin producción registrada)"
+        borrador = f"*COMUNICACIÓN INTERNA - {datetime.now().strftime('%d/%m/%Y')}*\n"
+        borrador += f"👤 Emisor: {st.session_state.user_name} ({st.session_state.veh_glob})\n"
+        borrador += f"----------------------------\n*AVANCE:*{resumen_prod}\n----------------------------\nMensaje: \n"
+        st.session_state.mensaje_base = borrador
+    if st.button("🔄 Actualizar datos del parte"):
+        del st.session_state.mensaje_base; st.rerun()
+    mensaje_final = st.text_area("✍️ Escribe tu mensaje:", value=st.session_state.mensaje_base, height=250)
+    import urllib.parse
+    mensaje_encoded = urllib.parse.quote(mensaje_final)
+    link_whatsapp = f"https://wa.me/{numero_destino}?text={mensaje_encoded}"
+    st.markdown("---")
+    _, col_btn, _ = st.columns([1, 2, 1])
+    with col_btn: st.link_button(label=f"📨 ENVIAR A {destinatario.upper()}", url=link_whatsapp, type="primary", use_container_width=True)
+    st.caption("🔒 Este mensaje está encriptado de punto a punto por WhatsApp.")
+
 # ==========================================
 #        PÁGINAS
 # ==========================================
 
+metricas.fijar_origen(st.session_state.current_page)
+
+# --- PÁGINA OCULTA: RENDIMIENTO (?admin=1) ---
+if st.query_params.get("admin") == "1":
+    st.title("📈 Rendimiento")
+    registros = pd.DataFrame(metricas.tabla())
+    if registros.empty: st.info("Sin registros todavía")
+    else:
+        llamadas = registros[registros["op"] != "rerun"]
+        st.subheader("Llamadas por operación (ms)")
+        por_op = llamadas.groupby("op")["ms"].quantile([0.5, 0.9, 0.99]).unstack().round(1)
+        por_op.columns = ["p50", "p90", "p99"]
+        por_op["n"] = llamadas.groupby("op").size()
+        por_op["errores"] = llamadas[llamadas["resultado"] != "ok"].groupby("op").size()
+        por_op["kB medio"] = (llamadas.groupby("op")["bytes"].mean() / 1024).round(1)
+        st.dataframe(por_op.fillna(0), use_container_width=True)
+        st.subheader("Llamadas por acción")
+        st.dataframe(llamadas.pivot_table(index="origen", columns="op", values="ms", aggfunc="count", fill_value=0), use_container_width=True)
+        reruns = registros[registros["op"] == "rerun"]
+        if not reruns.empty:
+            st.subheader("Reruns por página")
+            por_pag = reruns.groupby("origen")["ms"].quantile([0.5, 0.9, 0.99]).unstack().round(1)
+            por_pag.columns = ["p50", "p90", "p99"]
+            por_pag["n"] = reruns.groupby("origen").size()
+            por_pag["llamadas Google/rerun"] = reruns.groupby("origen")["llamadas"].mean().round(2)
+            st.dataframe(por_pag, use_container_width=True)
+    with st.expander("Exportación Prometheus"): st.code(metricas.prometheus(), language="text")
+    if st.button("🗑️ Vaciar métricas"): metricas.vaciar(); st.rerun()
+    if "email" in st.secrets:
+        st.subheader("📧 Bandeja de salida")
+        correos = pd.DataFrame(get_bandeja().ultimos(), columns=["id", "asunto", "estado", "intentos", "error", "creado", "enviado"])
+        for col in ("creado", "enviado"): correos[col] = pd.to_datetime(correos[col], unit="s")
+        st.dataframe(correos, use_container_width=True, hide_index=True)
+    descartadas = get_espejo().ultimas_descartadas()
+    if descartadas:
+        st.subheader(f"🪞 Backup descartado ({get_espejo().estado()['descartadas']})")
+        st.caption("Escrituras que el backup no aceptó tras varios intentos; el original sí está guardado.")
+        tabla_desc = pd.DataFrame(descartadas, columns=["t", "archivo", "hoja", "fila", "col", "valor", "error"])
+        tabla_desc["t"] = pd.to_datetime(tabla_desc["t"], unit="s")
+        st.dataframe(tabla_desc, use_container_width=True, hide_index=True)
+
+    st.divider()
+    st.subheader("📦 Partes en lote")
+    rosters = buscar_archivos_roster()
+    if not rosters: st.error("No hay Roster")
+    else:
+        roster_lote = st.selectbox("Roster", list(rosters.keys()))
+        hoy_lote = datetime.now().date()
+        cl1, cl2 = st.columns(2)
+        desde_lote = cl1.date_input("Desde", hoy_lote.replace(day=1))
+        hasta_lote = cl2.date_input("Hasta", hoy_lote)
+        if (desde_lote.year, desde_lote.month) != (hasta_lote.year, hasta_lote.month) or desde_lote > hasta_lote:
+            st.warning("El rango tiene que caer dentro de un mismo mes (un Roster por mes)")
+        elif st.button("📦 GENERAR PARTES", type="primary", use_container_width=True):
+            with st.spinner("Leyendo Roster y generando partes..."):
+                try:
+                    zip_partes, n_partes = generar_partes_lote(rosters[roster_lote], datetime.combine(desde_lote, datetime.min.time()),
+                                                               datetime.combine(hasta_lote, datetime.min.time()))
+                    st.success(f"✅ Partes generados: {n_partes}")
+                    st.download_button("📥 ZIP", zip_partes, f"Partes_{desde_lote}_{hasta_lote}.zip", "application/zip")
+                except Exception as e: st.error(f"❌ Error: {e}")
+
 # --- PÁGINA 1: HOME ---
-if st.session_state.current_page == "HOME":
+elif st.session_state.current_page == "HOME":
     st.markdown("<h1 style='text-align: center;'>🚧 GESTOR DE OBRA SEMI 🚧</h1>", unsafe_allow_html=True)
     st.markdown("---")
     
@@ -472,10 +1668,9 @@ elif st.session_state.current_page == "PARTES":
             st.divider()
             
             fl = st.radio("Filtro:", ["TODOS", "OBRA", "ALMACEN"], horizontal=True)
-            trabs = cargar_trabajadores(st.session_state.ID_ROSTER_ACTIVO)
-            if fl=="ALMACEN": fil = [t for t in trabs if t['tipo']=="ALMACEN"]; def_com=True
-            elif fl=="OBRA": fil = [t for t in trabs if t['tipo']!="ALMACEN"]; def_com=False
-            else: fil = trabs; def_com=False
+            # Modelo del Roster en memoria: cambiar de filtro o de día no descarga nada
+            fil = cargar_trabajadores(st.session_state.ID_ROSTER_ACTIVO, fecha_sel, fl)
+            def_com = fl == "ALMACEN"
             opc = [""] + [t['display'] for t in fil] if fil else ["Sin personal disponible"]
             trab_sel = st.selectbox("Seleccionar Operario", opc)
             
@@ -515,19 +1710,25 @@ elif st.session_state.current_page == "PARTES":
                 if not st.session_state.lista_sel: st.error("Lista vacía")
                 else:
                     with st.spinner("Guardando..."):
-                        ok = guardar_parte(fecha_sel, st.session_state.lista_sel, st.session_state.veh_glob, d_para, st.session_state.ID_ROSTER_ACTIVO)
-                        pdf = generar_pdf(str(fecha_sel.date()), st.session_state.veh_glob, st.session_state.lista_sel, d_para, st.session_state.prod_dia)
                         nm = f"Parte_{fecha_sel.date()}_{st.session_state.veh_glob}.pdf"
-                        try:
-                            if "email" in st.secrets: 
-                                enviar_email(pdf, nm, str(fecha_sel.date()), st.session_state.veh_glob)
-                                ms = "📧 Email enviado"
-                            else: ms = ""
-                        except: ms = "⚠️ Error Email"
+                        bandeja = get_bandeja() if "email" in st.secrets else None
+                        futuro_pdf = get_pool_pdf().submit(pdf_y_email, bandeja, f"Parte {fecha_sel.date()} {st.session_state.veh_glob}", nm,
+                                                           str(fecha_sel.date()), st.session_state.veh_glob, list(st.session_state.lista_sel), d_para, dict(st.session_state.prod_dia))
+                        ok = encolar_parte(fecha_sel, st.session_state.lista_sel, st.session_state.veh_glob, d_para, st.session_state.ID_ROSTER_ACTIVO)
                         if ok:
-                            st.success(f"✅ Guardado. {ms}")
-                            st.download_button("📥 PDF", pdf, nm, "application/pdf")
-                            st.session_state.lista_sel=[]; st.session_state.prod_dia={}; time.sleep(3); st.rerun()
+                            # El PDF no se espera aquí: el correo sale desde el pool y la descarga se ofrece al terminar
+                            st.session_state.parte_pdf = {"futuro": futuro_pdf, "nombre": nm}
+                            st.session_state.lista_sel=[]; st.session_state.prod_dia={}; st.rerun()
+
+            p_pdf = st.session_state.parte_pdf
+            if p_pdf and not p_pdf["futuro"].done(): esperar_pdf_parte()
+            elif p_pdf:
+                st.session_state.parte_pdf = None  # el aviso y la descarga salen una vez
+                try: pdf, ms = p_pdf["futuro"].result()
+                except Exception as e: st.error(f"❌ Parte guardado, pero falló el PDF: {e}")
+                else:
+                    st.success(f"✅ Guardado. {ms}")
+                    st.download_button("📥 PDF", pdf, p_pdf["nombre"], "application/pdf", on_click="ignore")
 
 # --- PÁGINA 3: PRODUCCIÓN ---
 elif st.session_state.current_page == "PRODUCCION":
@@ -546,45 +1747,29 @@ elif st.session_state.current_page == "PRODUCCION":
         bk = st.session_state.ARCH_BACKUP
         hjs = obtener_hojas_track_cached(nom)
         if hjs:
-            hj = st.selectbox("Hoja de Control", hjs, index=None)
+            c_hj, c_rec = st.columns([4, 1])
+            hj = c_hj.selectbox("Hoja de Control", hjs, index=None)
+            recargar = c_rec.button("🔄 Recargar", use_container_width=True, disabled=not hj)
             if hj:
                 with st.spinner("Cargando datos..."):
-                    datos_completos = cargar_datos_completos_hoja(nom, hj)
+                    hoja_cache = cargar_hoja_indexada(nom, hj, refrescar=recargar)
+                datos_completos = hoja_cache["datos"] if hoja_cache else None
                 
                 if datos_completos:
-                    todos_los_items = datos_completos.values()
-                    list_perfiles_ordenada = list(datos_completos.keys())
-                    list_cim = sorted(list(set(d['datos'][2] for d in todos_los_items if len(d['datos'])>2 and d['datos'][2])))
-                    list_post = sorted(list(set(d['datos'][5] for d in todos_los_items if len(d['datos'])>5 and d['datos'][5])))
-                    set_anc = set()
-                    for d in todos_los_items:
-                        row = d['datos']
-                        for idx in [17, 20, 23, 26]:
-                            if len(row) > idx and row[idx]: set_anc.add(row[idx])
-                    list_anc = sorted(list(set_anc))
+                    # Índices construidos al cargar la hoja: listas y filtros sin recorrer las filas
+                    indices = hoja_cache["indices"]
 
                     c_f1, c_f2, c_f3 = st.columns(3)
-                    fil_cim = c_f1.selectbox("Filtro Cimentación", ["Todos"] + list_cim)
-                    fil_post = c_f2.selectbox("Filtro Poste", ["Todos"] + list_post)
-                    fil_anc = c_f3.selectbox("Filtro Anclaje", ["Todos"] + list_anc)
-                    fil_km = st.text_input("Filtro Km")
-
-                    keys_filtradas = []
-                    for k, info in datos_completos.items():
-                        row = info['datos']
-                        if fil_km and fil_km not in str(k): continue
-                        if fil_cim != "Todos":
-                            val_c = row[2] if len(row)>2 else ""
-                            if val_c != fil_cim: continue
-                        if fil_post != "Todos":
-                            val_p = row[5] if len(row)>5 else ""
-                            if val_p != fil_post: continue
-                        if fil_anc != "Todos":
-                            vals_a = [row[i] for i in [17,20,23,26] if len(row)>i]
-                            if fil_anc not in vals_a: continue
-                        keys_filtradas.append(k)
-
-                    it = st.selectbox("Perfil a Trabajar", keys_filtradas)
+                    fil_cim = c_f1.selectbox("Filtro Cimentación", ["Todos"] + indices["list_cim"])
+                    fil_post = c_f2.selectbox("Filtro Poste", ["Todos"] + indices["list_post"])
+                    fil_anc = c_f3.selectbox("Filtro Anclaje", ["Todos"] + indices["list_anc"])
+                    fil_km = st.text_input("Filtro Km", placeholder="Prefijo, =exacto, rango 34+200-35+100 o un PK para saltar")
+
+                    keys_filtradas = filtrar_perfiles(indices, fil_cim, fil_post, fil_anc)
+                    sel_km, perfil_cercano = consultar_km(indices, fil_km)
+                    if sel_km is not None: keys_filtradas = [k for k in keys_filtradas if k in sel_km]
+                    it = selector_perfil("Perfil a Trabajar", indices, "perfil", keys_filtradas,
+                                         perfil_cercano if perfil_cercano in keys_filtradas else None)
                     
                     # -------------------------------------------------------------
                     # VISOR DE PLANOS AUTOMÁTICO (INTEGRADO AQUÍ)
@@ -621,16 +1806,10 @@ elif st.session_state.current_page == "PRODUCCION":
                             info = datos_completos[it]
                             fr = info['fila_excel']
                             d = info['datos']
-                            fp = safe_val(d, 8)
-                            estilo_detectado = "NORMAL"
-                            estilo_tendido = "NORMAL"
-                            if fp or safe_val(d, 39):
-                                try:
-                                    sh_temp = conectar_flexible(nom)
-                                    ws_temp = sh_temp.worksheet(hj)
-                                    if fp: estilo_detectado = detectar_estilo_celda(ws_temp, fr, 8)
-                                    estilo_tendido = detectar_estilo_celda(ws_temp, fr, 39)
-                                except: pass
+                            fp = safe_val(d, COL_POSTE_FECHA)
+                            # Estilos precalculados al cargar la hoja: cambiar de perfil no cuesta llamadas
+                            estilo_detectado = info['estilos'].get(COL_POSTE_FECHA, "NORMAL") if fp else "NORMAL"
+                            estilo_tendido = info['estilos'].get(COL_TENDIDO, "NORMAL")
                             
                             if not fp:
                                 st.session_state.chk_comp=False; st.session_state.chk_giros=False; st.session_state.chk_aisl=False
@@ -644,186 +1823,14 @@ elif st.session_state.current_page == "PRODUCCION":
                             st.session_state.estado_tendido_actual = estilo_tendido 
 
                         info = datos_completos[it]
-                        fr = info['fila_excel']
-                        d = info['datos']
-                        nombre_poste = safe_val(d, 6) 
-                        
                         tab_res, tab_cim, tab_pos_anc, tab_men, tab_ten, tab_wsp = st.tabs([
                             "📊 Resumen", "🧱 Cimentación", "🗼 Postes/Anc", "🔧 Ménsulas", "⚡ Tendidos", "📲 WhatsApp"
                         ])
+                        with tab_res: pestana_resumen(it, info)
+                        with tab_cim: pestana_cimentacion(nom, hj, bk, it, info)
+                        with tab_pos_anc: pestana_postes_anclajes(nom, hj, bk, it, info)
+                        with tab_men: pestana_mensulas(nom, hj, bk, it, info)
+                        with tab_ten: pestana_tendidos(nom, hj, bk, it, datos_completos, indices)
+                        with tab_wsp: pestana_whatsapp()
 
-                        with tab_res:
-                            st.markdown(f"### 📋 Perfil: {it} (Poste {nombre_poste})")
-                            st.markdown("---")
-                            f_cim_res = safe_val(d, 5)
-                            f_pos_res = safe_val(d, 8)
-                            f_men_res = safe_val(d, 38)
-                            nota_tendido = leer_nota_directa(nom, hj, fr, 39)
-                            info_tramo = nota_tendido.split("Tramo:")[1].split("\n")[0].strip() if "Tramo:" in nota_tendido else nota_tendido
-                            
-                            cr1, cr2 = st.columns(2)
-                            with cr1:
-                                if f_cim_res: st.success(f"🧱 Cim: ✅ {f_cim_res}")
-                                else: st.error("🧱 Cim: ❌")
-                                if f_pos_res: 
-                                    if not st.session_state.chk_giros or not st.session_state.chk_aisl:
-                                        st.warning(f"🗼 Poste: ⚠️ {f_pos_res}")
-                                    else: st.success(f"🗼 Poste: ✅ {f_pos_res}")
-                                else: st.error("🗼 Poste: ❌")
-                            with cr2:
-                                if f_men_res: st.success(f"🔧 Mén: ✅ {f_men_res}")
-                                else: st.error("🔧 Mén: ❌")
-                                est_ten = st.session_state.get("estado_tendido_actual", "NORMAL")
-                                if est_ten == "TENDIDO_AZUL": st.info(f"⚡ Cable: 🔵 TENDIDO\n\n📍 {info_tramo}")
-                                elif est_ten == "GRAPADO_VERDE": st.success(f"⚡ Cable: ✅ GRAPADO\n\n📍 {info_tramo}")
-                                else: st.error("⚡ Cable: ❌ PENDIENTE")
-
-                        with tab_cim:
-                            st.subheader("Fase de Obra Civil")
-                            c1, c2 = st.columns([1, 2])
-                            ec, fc = safe_val(d, 3), safe_val(d, 5)
-                            c1.info(f"Tipo: {ec}")
-                            if fc: c2.success(f"✅ Ejecutado el: {fc}")
-                            elif c2.button("Grabar CIMENTACIÓN", use_container_width=True):
-                                guardar_prod_con_nota_compleja(nom, hj, fr, 5, datetime.now().strftime("%d/%m/%Y"), st.session_state.veh_glob, bk)
-                                if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
-                                st.session_state.prod_dia[it].append("CIM"); st.rerun()
-
-                        with tab_pos_anc:
-                            st.subheader("1. Estructura (Poste)")
-                            c1, c2 = st.columns([1, 2])
-                            ep, fp = safe_val(d, 6), safe_val(d, 8)
-                            c1.info(f"Tipo: {ep}")
-                            if st.session_state.chk_comp and fp:
-                                c2.success(f"✅ TERMINADO: {fp}")
-                            else:
-                                with c2:
-                                    cc1, cc2, cc3 = st.columns(3)
-                                    st.session_state.chk_giros = cc1.checkbox("Giros", value=st.session_state.chk_giros)
-                                    st.session_state.chk_aisl = cc2.checkbox("Aisladores", value=st.session_state.chk_aisl)
-                                    st.session_state.chk_comp = cc3.checkbox("Completo", value=st.session_state.chk_comp, on_change=on_completo_change)
-                                    if st.button("💾 Grabar POSTE", use_container_width=True):
-                                        txt = ""; estilo = "NORMAL"
-                                        if not st.session_state.chk_giros: txt += "GIROS FALTAN. "; estilo = "GIROS"
-                                        if not st.session_state.chk_aisl: txt += "AISLADORES FALTAN. "; estilo = "AISLADORES"
-                                        if st.session_state.chk_comp: estilo = "NORMAL"
-                                        guardar_prod_con_nota_compleja(nom, hj, fr, 8, datetime.now().strftime("%d/%m/%Y"), st.session_state.veh_glob, bk, txt, estilo_letra=estilo)
-                                        if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
-                                        st.session_state.prod_dia[it].append("POSTE"); st.rerun()
-                            
-                            st.divider(); st.subheader("2. Anclajes")
-                            cols_t, cols_f = [18, 21, 24, 27], [20, 23, 26, 29]
-                            typs, cols_escritura, done = [], [], False
-                            for i in range(4):
-                                v = safe_val(d, cols_t[i])
-                                if v:
-                                    typs.append(str(v)); cols_escritura.append(cols_f[i])
-                                    if safe_val(d, cols_f[i]): done = True
-                            c1, c2 = st.columns([1, 2])
-                            c1.info(f"Tipos: {', '.join(typs) if typs else 'Ninguno'}")
-                            if not typs: c2.write("-")
-                            elif done: c2.success("✅ Completos")
-                            elif c2.button("Grabar ANCLAJES", use_container_width=True):
-                                hoy = datetime.now().strftime("%d/%m/%Y")
-                                for c_idx in cols_escritura:
-                                    guardar_prod_con_nota_compleja(nom, hj, fr, c_idx, hoy, st.session_state.veh_glob, bk)
-                                if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
-                                st.session_state.prod_dia[it].append("ANC"); st.rerun()
-
-                        with tab_men:
-                            st.subheader("Equipamiento: Ménsulas")
-                            c1, c2 = st.columns([1, 2])
-                            m_desc = f"{safe_val(d,32) or ''} {safe_val(d,33) or ''}".strip()
-                            fm = safe_val(d, 38)
-                            c1.info(f"Tipo: {m_desc or '-'}")
-                            if fm: c2.success(f"Hecho: {fm}")
-                            elif c2.button("Grabar MÉNSULA", use_container_width=True):
-                                guardar_prod_con_nota_compleja(nom, hj, fr, 38, datetime.now().strftime("%d/%m/%Y"), st.session_state.veh_glob, bk)
-                                if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
-                                st.session_state.prod_dia[it].append("MEN"); st.rerun()
-
-                        with tab_ten:
-                            st.subheader("⚡ Tendido Cable LA-280")
-                            f_la280 = safe_val(d, 39)
-                            est_ten = st.session_state.get("estado_tendido_actual", "NORMAL")
-                            c1, c2 = st.columns([1,2])
-                            if est_ten == "TENDIDO_AZUL": c1.info("Estado:"); c2.info("🔵 TENDIDO (Falta Grapar)")
-                            elif est_ten == "GRAPADO_VERDE": c1.success("Estado:"); c2.success("✅ GRAPADO (Finalizado)")
-                            else: c1.warning("Estado:"); c2.error("❌ PENDIENTE")
-
-                            st.divider()
-                            st.write("### 🛤️ Gestión de Tramos")
-                            idx_def = 0
-                            if it in list_perfiles_ordenada: idx_def = list_perfiles_ordenada.index(it)
-                            col_sel1, col_sel2 = st.columns(2)
-                            
-                            p_ini = col_sel1.selectbox("Desde Perfil:", list_perfiles_ordenada, index=idx_def, key=f"s_ini_{it}")
-                            p_fin = col_sel2.selectbox("Hasta Perfil:", list_perfiles_ordenada, index=idx_def, key=f"s_fin_{it}")
-                            
-                            fecha_tendido = datetime.now().strftime("%d/%m/%Y")
-                            cb1, cb2 = st.columns(2)
-                            btn_t = cb1.button("🚀 TENDIDO (Azul)", use_container_width=True)
-                            btn_g = cb2.button("✅ GRAPADO (Verde)", use_container_width=True)
-
-                            if btn_t or btn_g:
-                                try:
-                                    idx_a = list_perfiles_ordenada.index(p_ini)
-                                    idx_b = list_perfiles_ordenada.index(p_fin)
-                                    if idx_a > idx_b: idx_a, idx_b = idx_b, idx_a
-                                    perfiles_rango = list_perfiles_ordenada[idx_a : idx_b + 1]
-                                    total_p = len(perfiles_rango)
-                                    if btn_t: estilo_uso = "TENDIDO_AZUL"; accion_txt = "TENDIDO"
-                                    else: estilo_uso = "GRAPADO_VERDE"; accion_txt = "GRAPADO"
-                                    st.write(f"⏳ Procesando {total_p} perfiles...")
-                                    barra = st.progress(0); contador = 0
-                                    for i, perfil_id in enumerate(perfiles_rango):
-                                        if perfil_id in datos_completos:
-                                            fila_real = datos_completos[perfil_id]['fila_excel']
-                                            es_extremo = (i == 0) or (i == total_p - 1)
-                                            valor_a_escribir = fecha_tendido if es_extremo else ""
-                                            guardar_prod_con_nota_compleja(
-                                                nom, hj, fila_real, 39, 
-                                                valor_a_escribir, st.session_state.veh_glob, bk, 
-                                                texto_extra=f"Tramo: {p_ini} -> {p_fin}",
-                                                estilo_letra=estilo_uso
-                                            )
-                                            contador += 1
-                                            barra.progress(int((contador / total_p) * 100))
-                                    st.success(f"✅ {accion_txt} registrado."); time.sleep(2)
-                                    if it not in st.session_state.prod_dia: st.session_state.prod_dia[it]=[]
-                                    st.session_state.prod_dia[it].append(f"{accion_txt} ({p_ini}-{p_fin})"); st.rerun()
-                                except Exception as e: st.error(f"Error: {e}")
-
-                        with tab_wsp:
-                            st.subheader("🔒 Red de Comunicación Interna")
-                            st.info("Sistema protegido. Solo se permite comunicación con dispositivos autorizados.")
-                            agenda_segura = {
-                                "Tablet 01 (Cimentación)": "972500000001", "Tablet 02 (Postes)": "972500000002",
-                                "Tablet 03 (Tendidos)": "972500000003", "Jefe de Obra (Emergencia)": "972500000000",
-                                "Oficina Técnica": "972500000099"
-                            }
-                            col_dest, col_info = st.columns([2, 1])
-                            with col_dest:
-                                destinatario = st.selectbox(" Seleccionar Destinatario:", list(agenda_segura.keys()))
-                                numero_destino = agenda_segura[destinatario]
-                            with col_info: st.success(f"📡 Conectado con:\n**{destinatario}**")
-                            st.markdown("---")
-                            if 'mensaje_base' not in st.session_state:
-                                resumen_prod = ""
-                                if st.session_state.prod_dia:
-                                    for k, v in st.session_state.prod_dia.items(): resumen_prod += f"\n- {k}: {', '.join(v)}"
-                                else: resumen_prod = "\n(Sin producción registrada)"
-                                borrador = f"*COMUNICACIÓN INTERNA - {datetime.now().strftime('%d/%m/%Y')}*\n"
-                                borrador += f"👤 Emisor: {st.session_state.user_name} ({st.session_state.veh_glob})\n"
-                                borrador += f"----------------------------\n*AVANCE:*{resumen_prod}\n----------------------------\nMensaje: \n"
-                                st.session_state.mensaje_base = borrador
-                            if st.button("🔄 Actualizar datos del parte"):
-                                del st.session_state.mensaje_base; st.rerun()
-                            mensaje_final = st.text_area("✍️ Escribe tu mensaje:", value=st.session_state.mensaje_base, height=250)
-                            import urllib.parse
-                            mensaje_encoded = urllib.parse.quote(mensaje_final)
-                            link_whatsapp = f"https://wa.me/{numero_destino}?text={mensaje_encoded}"
-                            st.markdown("---")
-                            _, col_btn, _ = st.columns([1, 2, 1])
-                            with col_btn: st.link_button(label=f"📨 ENVIAR A {destinatario.upper()}", url=link_whatsapp, type="primary", use_container_width=True)
-                            st.caption("🔒 Este mensaje está encriptado de punto a punto por WhatsApp.")
+metricas.fin_rerun(st.session_state.current_page)
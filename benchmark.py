@@ -0,0 +1,408 @@
+# ==========================================
+#     BANCO DE PRUEBAS DE RENDIMIENTO (SIN RED)
+# ==========================================
+# Ejecuta app.py de verdad (streamlit.testing AppTest) contra un Google falso en memoria:
+# hojas HR TRACK con miles de perfiles, notas y formatos, el Roster con la cabecera E4:AX9,
+# la configuración de tramos y los vehículos. Cada llamada falsa espera la latencia indicada.
+# Por escenario se informa del tiempo y de las llamadas a Google por operación.
+# Al final se mide el parte en PDF con 5 y 60 operarios (tiempo, tamaño y páginas).
+#
+#   python benchmark.py --perfiles 3000 --latencia 0.15 --json resultados.json
+
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from unittest import mock
+
+import gspread
+from gspread.utils import a1_to_rowcol
+import googleapiclient.discovery
+from google.oauth2 import service_account
+from oauth2client.service_account import ServiceAccountCredentials
+import streamlit.config
+import streamlit.logger
+from streamlit.testing.v1 import AppTest
+
+from partes_pdf import generar_pdf
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+ID_VEHICULOS = "19PWpeCz8pl5NEDpK-omX5AdrLuJgOPrn6uSjtUGomY8"
+ID_CONFIG_PROD = "1uCu5pq6l1CjqXKPEkGkN-G5Z5K00qiV9kR_bGOii6FU"
+ID_ROSTER, ID_TRACK, ID_BACKUP = "falso-roster", "falso-track-1", "falso-track-1-bk"
+TRAMO = "TRAMO 1"
+
+# ==========================================
+#     GOOGLE FALSO
+# ==========================================
+def fecha_de_serie(serie):
+    return (datetime(1899, 12, 30) + timedelta(days=int(serie))).strftime("%d/%m/%Y")
+
+class GoogleFalso:
+    def __init__(self, latencia=0.1, jitter=0.03):
+        self.latencia, self.jitter = latencia, jitter
+        self.lock = threading.Lock()
+        self.llamadas = Counter()
+        self.ultima = time.time()
+        self.libros = {}  # id -> LibroFalso
+
+    def llamada(self, op):
+        time.sleep(max(0.0, self.latencia + random.uniform(-self.jitter, self.jitter)))
+        with self.lock:
+            self.llamadas[op] += 1
+            self.ultima = time.time()
+
+    def contadores(self):
+        with self.lock: return Counter(self.llamadas)
+
+    def esperar(self, condicion, timeout=30):
+        limite = time.time() + timeout
+        while time.time() < limite:
+            if condicion(): return True
+            time.sleep(0.05)
+        return False
+
+    def esperar_calma(self, quieto=0.8, timeout=60):
+        # Hasta que las precargas y los hilos de fondo dejan de llamar
+        return self.esperar(lambda: time.time() - self.ultima > quieto, timeout)
+
+    def libro(self, clave):
+        if clave in self.libros: return self.libros[clave]
+        return next((l for l in self.libros.values() if l.title == clave), None)
+
+class HojaFalsa:
+    def __init__(self, google, id, title, valores):
+        self.google, self.id, self.title = google, id, title
+        self.valores = valores
+        self.notas, self.formatos = {}, {}  # (fila, col) base 1 -> nota / userEnteredFormat
+
+    def _rectangular(self):
+        ancho = max((len(f) for f in self.valores), default=0)
+        return [list(f) + [""] * (ancho - len(f)) for f in self.valores]
+
+    def get_all_values(self):
+        self.google.llamada("get_all_values")
+        return self._rectangular()
+
+    def col_values(self, col):
+        self.google.llamada("col_values")
+        return [f[col - 1] if len(f) >= col else "" for f in self.valores]
+
+    def poner(self, fila, col, valor):
+        while len(self.valores) < fila: self.valores.append([])
+        f = self.valores[fila - 1]
+        if len(f) < col: f.extend([""] * (col - len(f)))
+        f[col - 1] = valor
+
+class LibroFalso:
+    def __init__(self, google, id, title, hojas):
+        self.google, self.id, self.title, self.hojas = google, id, title, hojas
+        self.version = 1
+
+    def worksheets(self):
+        self.google.llamada("worksheets")
+        return list(self.hojas)
+
+    def _hoja(self, titulo=None, sheet_id=None):
+        return next(h for h in self.hojas if h.title == titulo or h.id == sheet_id)
+
+    def values_batch_get(self, rangos, params=None):
+        self.google.llamada("values_batch_get")
+        bloques = []
+        for rango in rangos:
+            titulo, desde, hasta = re.match(r"^'(.*)'!([A-Z]+):([A-Z]+)$", rango).groups()
+            a, b = a1_to_rowcol(f"{desde}1")[1], a1_to_rowcol(f"{hasta}1")[1]
+            filas = [[str(v) for v in f[a - 1:b]] for f in self._hoja(titulo).valores]
+            for f in filas:
+                while f and f[-1] == "": f.pop()
+            while filas and not filas[-1]: filas.pop()
+            bloques.append({"range": rango, "values": filas} if filas else {"range": rango})
+        return {"valueRanges": bloques}
+
+    def fetch_sheet_metadata(self, params=None):
+        self.google.llamada("fetch_sheet_metadata")
+        datos, hoja = [], None
+        for rango in params.get("ranges", []):
+            titulo, desde, hasta = re.match(r"^'(.*)'!([A-Z]+):([A-Z]+)$", rango).groups()
+            hoja, a, b = self._hoja(titulo), a1_to_rowcol(f"{desde}1")[1], a1_to_rowcol(f"{hasta}1")[1]
+            filas = []
+            for fila in range(1, len(hoja.valores) + 1):
+                celdas = []
+                for col in range(a, b + 1):
+                    celda = {}
+                    if (fila, col) in hoja.notas: celda["note"] = hoja.notas[(fila, col)]
+                    if (fila, col) in hoja.formatos: celda["userEnteredFormat"] = hoja.formatos[(fila, col)]
+                    celdas.append(celda)
+                while celdas and not celdas[-1]: celdas.pop()
+                filas.append({"values": celdas} if celdas else {})
+            datos.append({"startColumn": a - 1, "rowData": filas})
+        return {"sheets": [{"data": datos}]}
+
+    def batch_update(self, cuerpo):
+        self.google.llamada("batch_update")
+        for p in cuerpo["requests"]:
+            if "updateCells" in p:
+                u = p["updateCells"]
+                hoja = self._hoja(sheet_id=u["start"]["sheetId"])
+                for i, fila in enumerate(u["rows"]):
+                    for j, celda in enumerate(fila["values"]):
+                        f, c = u["start"]["rowIndex"] + i + 1, u["start"]["columnIndex"] + j + 1
+                        uv = celda.get("userEnteredValue") or {}
+                        if "numberValue" in uv:
+                            fmt = celda.get("userEnteredFormat", {}).get("numberFormat", {})
+                            hoja.poner(f, c, fecha_de_serie(uv["numberValue"]) if fmt.get("type") == "DATE" else uv["numberValue"])
+                        elif "userEnteredValue" in u["fields"] or "stringValue" in uv: hoja.poner(f, c, uv.get("stringValue", ""))
+                        if "note" in celda:
+                            if celda["note"]: hoja.notas[(f, c)] = celda["note"]
+                            else: hoja.notas.pop((f, c), None)
+                        if "userEnteredFormat" in celda: hoja.formatos[(f, c)] = celda["userEnteredFormat"]
+            elif "addSheet" in p:
+                prop = p["addSheet"]["properties"]
+                self.hojas.append(HojaFalsa(self.google, prop["sheetId"], prop["title"], []))
+            elif "appendCells" in p:
+                a = p["appendCells"]
+                hoja = self._hoja(sheet_id=a["sheetId"])
+                for fila in a["rows"]: hoja.valores.append([next(iter(v["userEnteredValue"].values())) for v in fila["values"]])
+        self.version += 1
+        return {"replies": []}
+
+class ClienteFalso:
+    def __init__(self, google): self.google = google
+
+    def open_by_key(self, clave):
+        self.google.llamada("open_by_key")
+        libro = self.google.libros.get(clave)
+        if libro is None: raise gspread.SpreadsheetNotFound(clave)
+        return libro
+
+    def open(self, nombre):
+        self.google.llamada("open")
+        libro = self.google.libro(nombre)
+        if libro is None: raise gspread.SpreadsheetNotFound(nombre)
+        return libro
+
+# --- Drive v3: files.list, files.get y batch HTTP ---
+class PeticionDrive:
+    def __init__(self, google, op, respuesta): self.google, self.op, self.respuesta = google, op, respuesta
+    def execute(self):
+        self.google.llamada(self.op)
+        return self.respuesta()
+
+class LoteDrive:
+    def __init__(self, google, callback): self.google, self.callback, self.peticiones = google, callback, []
+    def add(self, peticion): self.peticiones.append(peticion)
+    def execute(self):
+        self.google.llamada("drive_batch")
+        for i, p in enumerate(self.peticiones): self.callback(str(i), p.respuesta(), None)
+
+class DriveFalso:
+    def __init__(self, google): self.google = google
+    def files(self): return self
+    def new_batch_http_request(self, callback=None): return LoteDrive(self.google, callback)
+
+    def list(self, q="", fields="", orderBy=""):
+        return PeticionDrive(self.google, "drive_list", lambda: {"files": [{"id": l.id, "name": l.title} for l in self.google.libros.values() if "Roster" in l.title]})
+
+    def get(self, fileId, fields=""):
+        libro = self.google.libros[fileId]
+        return PeticionDrive(self.google, "drive_get", lambda: {"id": fileId, "version": str(libro.version), "modifiedTime": f"v{libro.version}"})
+
+# ==========================================
+#     DATOS DE OBRA REALISTAS
+# ==========================================
+def perfil_id(i): return f"{34 + (i * 60) // 1000}+{(i * 60) % 1000:03d}"
+
+def hoja_track(google, id, titulo, desde, n, hechos=0.4):
+    rnd = random.Random(id)
+    filas = [["HR TRACK " + titulo], ["ITEM", "", "CIM", "", "F.CIM", "POSTE", "", "F.POSTE"]]
+    hoja = HojaFalsa(google, id, titulo, filas)
+    for i in range(desde, desde + n):
+        f = [""] * 50
+        f[0], f[2], f[5] = perfil_id(i), rnd.choice(["M1", "M2", "M3", "HA-2"]), f"P-{i}"
+        if rnd.random() < 0.3: f[17], f[20] = rnd.choice(["AT-1", "AT-2"]), rnd.choice(["", "AF"])
+        f[31], f[32] = rnd.choice(["MS-1", "MS-2"]), rnd.choice(["", "D"])
+        f[49] = f"https://drive.google.com/plano/{perfil_id(i)}"
+        filas.append(f)
+        fila = len(filas)
+        if rnd.random() < hechos:
+            f[4] = f[7] = "03/02/2026"
+            if rnd.random() < 0.2: hoja.formatos[(fila, 8)] = {"textFormat": {"fontFamily": "Courier New"}}
+            if rnd.random() < 0.5:
+                f[37] = "05/02/2026"
+                f[38] = rnd.choice(["", "06/02/2026"])
+                hoja.formatos[(fila, 39)] = {"backgroundColor": {"red": 0.4, "green": 0.6, "blue": 1.0}}
+                hoja.notas[(fila, 39)] = f"📅 06/02/2026 - 08:30\n🚛 FURGO 1\n👷 Usuario Tablet\n⚠️ TENDIDO (Tramo: {perfil_id(i)} -> {perfil_id(i + 5)})"
+            hoja.notas[(fila, 8)] = "📅 03/02/2026 - 10:15\n🚛 FURGO 2\n👷 Usuario Tablet"
+    return hoja
+
+def hoja_roster(google, trabajadores):
+    filas = [["ROSTER"], [], []] + [[] for _ in range(6)]
+    filas[5] = [""] * 4 + [str(d) for d in range(1, 32)]  # días en E6:AI6 (dentro de E4:AX9)
+    filas[8] = ["ID", "NOMBRE", "TIPO"]
+    for i in range(trabajadores): filas.append([f"{1000 + i}", f"Operario {i}", "A" if i % 5 == 0 else "O"])
+    return HojaFalsa(google, 0, "Roster", filas)
+
+def montar_google(perfiles, trabajadores, latencia, jitter):
+    g = GoogleFalso(latencia, jitter)
+    mitad = perfiles // 2
+    track = [hoja_track(g, 1, "HR TRACK 1", 0, mitad), hoja_track(g, 2, "HR TRACK 2", mitad, perfiles - mitad), HojaFalsa(g, 3, "Resumen", [["x"]])]
+    backup = [hoja_track(g, 1, "HR TRACK 1", 0, mitad), hoja_track(g, 2, "HR TRACK 2", mitad, perfiles - mitad)]
+    g.libros = {
+        ID_TRACK: LibroFalso(g, ID_TRACK, "HR TRACK TRAMO 1", track),
+        ID_BACKUP: LibroFalso(g, ID_BACKUP, "HR TRACK TRAMO 1 BACKUP", backup),
+        ID_ROSTER: LibroFalso(g, ID_ROSTER, "Roster 2026", [hoja_roster(g, trabajadores), HojaFalsa(g, 7, "Paralizaciones", [["Fecha"]])]),
+        ID_CONFIG_PROD: LibroFalso(g, ID_CONFIG_PROD, "Config Produccion", [HojaFalsa(g, 0, "Config", [["Tramo", "Archivo", "Backup"], [TRAMO, ID_TRACK, ID_BACKUP]])]),
+        ID_VEHICULOS: LibroFalso(g, ID_VEHICULOS, "Vehiculos", [HojaFalsa(g, 0, "Vehiculos", [["Vehiculo", "Telefono"], ["FURGO 1", "600000001"], ["FURGO 2", "600000002"]])]),
+    }
+    return g
+
+# ==========================================
+#     ESCENARIOS
+# ==========================================
+def widget(lista, etiqueta):
+    return next(w for w in lista if w.label == etiqueta)
+
+def boton(at, etiqueta):
+    return next(b for b in at.button if b.label == etiqueta)
+
+def fila_de(g, hoja, item):
+    return next(i + 1 for i, f in enumerate(g.libros[ID_TRACK]._hoja(hoja).valores) if f and f[0] == item)
+
+def perfil_libre(g, hoja, col, con=None):
+    for f in g.libros[ID_TRACK]._hoja(hoja).valores[2:]:
+        if len(f) >= col and not f[col - 1] and (con is None or f[con - 1]): return f[0]
+
+class Banco:
+    def __init__(self, g, timeout):
+        self.g, self.timeout, self.resultados = g, timeout, []
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+
+    def medir(self, nombre, accion, hasta=None):
+        antes, t0 = self.g.contadores(), time.perf_counter()
+        accion(self.at)
+        if self.at.exception: raise RuntimeError(f"{nombre}: {self.at.exception[0].message}")
+        t_ui = time.perf_counter() - t0
+        if hasta and not self.g.esperar(hasta, self.timeout): print(f"   ⚠️ {nombre}: la escritura no llegó a Google")
+        t_google = time.perf_counter() - t0
+        self.g.esperar_calma()
+        llamadas = self.g.contadores() - antes
+        self.resultados.append({"escenario": nombre, "ui_s": round(t_ui, 3), "google_s": round(t_google, 3),
+                                "llamadas": sum(llamadas.values()), "por_op": dict(sorted(llamadas.items()))})
+        print(f"{nombre:<34} ui {t_ui:7.3f}s  google {t_google:7.3f}s  llamadas {sum(llamadas.values()):4d}  {dict(sorted(llamadas.items()))}")
+
+def ejecutar(g, args):
+    b = Banco(g, args.timeout)
+    escrituras = lambda: g.contadores()["batch_update"]
+    hoja = "HR TRACK 1"
+    b.medir("arranque en frío", lambda at: at.run())
+    b.medir("rerun en caliente", lambda at: at.run())
+    b.medir("elegir tramo y vehículo", lambda at: widget(at.selectbox, "1️⃣ Seleccionar Tramo:").set_value(TRAMO).run())
+    b.medir("abrir PRODUCCIÓN", lambda at: at.button(key="btn_prod").click().run())
+    b.medir("cargar hoja HR TRACK", lambda at: widget(at.selectbox, "Hoja de Control").set_value(hoja).run())
+
+    # El selector solo trae una página de resultados: los perfiles se eligen tecleando el ID (coincidencia exacta primero)
+    buscar = lambda at, texto: widget(at.text_input, "🔎 Buscar (Perfil a Trabajar)").set_value(texto).run()
+    perfiles = [f[0] for f in g.libros[ID_TRACK]._hoja(hoja).valores[2:]]
+    for n, p in enumerate(random.Random(1).sample(perfiles, min(5, len(perfiles)))):
+        b.medir(f"buscar perfil #{n + 1}", lambda at: buscar(at, p))
+    b.medir("buscar por subcadena", lambda at: buscar(at, perfiles[len(perfiles) // 3][-3:]))
+    def pagina_siguiente(at):
+        buscar(at, "")
+        at.button(key="perfil_sig").click().run()
+    b.medir("página siguiente", pagina_siguiente)
+    b.medir("filtro cimentación", lambda at: widget(at.selectbox, "Filtro Cimentación").set_value("M2").run())
+    b.medir("filtro km (salto a PK)", lambda at: widget(at.text_input, "Filtro Km").set_value(perfiles[len(perfiles) // 2]).run())
+    def sin_filtros(at):
+        widget(at.selectbox, "Filtro Cimentación").set_value("Todos")
+        widget(at.text_input, "Filtro Km").set_value("").run()
+    b.medir("quitar filtros", sin_filtros)
+
+    def grabar(perfil, etiqueta):
+        def accion(at):
+            buscar(at, perfil)
+            boton(at, etiqueta).click().run()
+        return accion
+    p_poste = perfil_libre(g, hoja, 8)
+    n = escrituras(); b.medir("grabar POSTE", grabar(p_poste, "💾 Grabar POSTE"), lambda n=n: escrituras() > n)
+    p_anc = perfil_libre(g, hoja, 20, con=18)
+    if p_anc:
+        n = escrituras(); b.medir("grabar ANCLAJES", grabar(p_anc, "Grabar ANCLAJES"), lambda n=n: escrituras() > n)
+    i0 = perfiles.index(perfil_libre(g, hoja, 39))
+    def tendido(at):
+        buscar(at, perfiles[i0])
+        widget(at.text_input, "Rango por PK (ej. 34+200-35+100)").set_value(f"{perfiles[i0]}-{perfiles[min(i0 + 19, len(perfiles) - 1)]}").run()
+        boton(at, "🚀 TENDIDO (Azul)").click().run()
+    n = escrituras(); b.medir("grabar TENDIDO (20 perfiles)", tendido, lambda n=n: escrituras() > n)
+
+    def parte(at):
+        boton(at, "⬅️ VOLVER AL MENÚ").click().run()
+        at.button(key="btn_partes").click().run()
+        for _ in range(3):
+            widget(at.selectbox, "Seleccionar Operario").select_index(1).run()
+            boton(at, "➕ AÑADIR").click().run()
+        boton(at, "💾 GUARDAR TODO").click().run()
+    roster = g.libros[ID_ROSTER]
+    v = roster.version
+    b.medir("guardar_parte (3 operarios)", parte, lambda: roster.version > v)
+    return b.resultados
+
+def banco_pdf(repeticiones):
+    # Parte diario con 5 y 60 operarios: tiempo medio de generación, tamaño y páginas
+    para = {"inicio": "10:00", "fin": "11:00", "duracion": 1.0, "motivo": "Lluvia"}
+    resultados = []
+    for n in (5, 60):
+        lista = [{"ID": str(1000 + i), "Nombre": f"Operario {i}", "Total_Horas": 9.5 if i % 3 else 8.0, "Turno_Letra": "D",
+                  "H_Inicio": "07:00", "H_Fin": "16:30", "Es_Noche": i % 7 == 0} for i in range(n)]
+        prod = {perfil_id(i): ["POSTE", "ANC"] for i in range(n // 3)}
+        t0 = time.perf_counter()
+        for _ in range(repeticiones): pdf = generar_pdf("2026-02-03", "FURGO 1", lista, para, prod).getvalue()
+        ms = (time.perf_counter() - t0) * 1000 / repeticiones
+        paginas = len(re.findall(rb"/Type /Page\b", pdf))
+        resultados.append({"escenario": f"PDF {n} operarios", "ms": round(ms, 2), "bytes": len(pdf), "paginas": paginas})
+        print(f"{'PDF ' + str(n) + ' operarios':<34} {ms:8.2f} ms  {len(pdf):7d} bytes  {paginas} páginas")
+    return resultados
+
+def main():
+    ap = argparse.ArgumentParser(description="Banco de pruebas de app.py contra un Google falso")
+    ap.add_argument("--perfiles", type=int, default=3000)
+    ap.add_argument("--trabajadores", type=int, default=120)
+    ap.add_argument("--latencia", type=float, default=0.15, help="segundos por llamada a Google")
+    ap.add_argument("--jitter", type=float, default=0.03)
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--pdf-repeticiones", type=int, default=20)
+    ap.add_argument("--json", help="guardar los resultados en este archivo")
+    args = ap.parse_args()
+    # Avisos sin interés aquí (hilos de fondo sin ScriptRunContext en AppTest, deprecaciones)
+    streamlit.config.set_option("logger.level", "error")
+    streamlit.logger.set_log_level("ERROR")
+
+    g = montar_google(args.perfiles, args.trabajadores, args.latencia, args.jitter)
+    # Directorio de trabajo temporal: secretos de mentira y las bases SQLite de la app (diario, instantáneas)
+    trabajo = tempfile.mkdtemp(prefix="semi-bench-")
+    os.makedirs(os.path.join(trabajo, ".streamlit"))
+    with open(os.path.join(trabajo, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write('[gcp_service_account]\ntype = "service_account"\nclient_email = "banco@falso"\n')
+    salida = os.path.abspath(args.json) if args.json else None
+    os.chdir(trabajo)
+    with mock.patch.object(gspread, "authorize", lambda *a, **k: ClienteFalso(g)), \
+         mock.patch.object(ServiceAccountCredentials, "from_json_keyfile_dict", lambda *a, **k: None), \
+         mock.patch.object(service_account.Credentials, "from_service_account_info", lambda *a, **k: None), \
+         mock.patch.object(googleapiclient.discovery, "build", lambda *a, **k: DriveFalso(g)):
+        print(f"📐 {args.perfiles} perfiles · {args.trabajadores} operarios · latencia {args.latencia}s ± {args.jitter}s · {trabajo}")
+        resultados = ejecutar(g, args)
+    total = sum(r["llamadas"] for r in resultados)
+    print(f"{'TOTAL':<34} llamadas {total}")
+    resultados += banco_pdf(args.pdf_repeticiones)
+    if salida:
+        with open(salida, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+    os._exit(0)  # los hilos de fondo de la app (diario, refresco) no terminan solos
+
+if __name__ == "__main__":
+    main()
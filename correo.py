@@ -0,0 +1,129 @@
+# ==========================================
+#     BANDEJA DE SALIDA DE CORREO
+# ==========================================
+# Cola en SQLite de los correos de partes, entregada por un hilo con una conexión SMTP por ráfaga.
+import smtplib
+import sqlite3
+import threading
+import time
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+
+MAX_INTENTOS_CORREO = 10
+INACTIVIDAD_SMTP = 60  # s que la conexión SMTP sigue abierta esperando más correos de la ráfaga
+PLAZO_ENVIO = 300  # s que un correo reclamado (ENVIANDO) es de quien lo reclamó; si su proceso muere, se retoma
+# Fallos del propio mensaje: no dicen nada de la conexión, que se sigue usando para los demás
+ERRORES_MENSAJE = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+class BandejaCorreo:
+    def __init__(self, ruta, config, metricas=None):
+        self.config = config  # () -> dict de config_correo; se lee al abrir cada conexión
+        self.metricas = metricas
+        self.lock = threading.Lock()
+        self.aviso = threading.Event()
+        self.smtp, self.t_uso = None, 0
+        self.db = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS correos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, asunto TEXT, adjunto_nombre TEXT, adjunto BLOB,
+            estado TEXT DEFAULT 'PENDIENTE', intentos INTEGER DEFAULT 0, proximo REAL DEFAULT 0, error TEXT, creado REAL, enviado REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_correos_estado ON correos (estado, proximo)")
+        self.db.commit()
+
+    def encolar(self, asunto, nombre, adjunto):
+        with self.lock:
+            cur = self.db.execute("INSERT INTO correos (asunto, adjunto_nombre, adjunto, creado) VALUES (?,?,?,?)",
+                                  (asunto, nombre, adjunto, time.time()))
+            self.db.commit()
+        self.aviso.set()
+        return cur.lastrowid
+
+    def _consultar(self, sql, params=()):
+        with self.lock: return self.db.execute(sql, params).fetchall()
+
+    def pendientes(self): return self._consultar("SELECT COUNT(*) FROM correos WHERE estado IN ('PENDIENTE','ENVIANDO')")[0][0]
+    def fallidos(self): return self._consultar("SELECT COUNT(*) FROM correos WHERE estado='FALLIDO'")[0][0]
+
+    def estado(self, id_correo):
+        r = self._consultar("SELECT estado FROM correos WHERE id=?", (id_correo,))
+        return r[0][0] if r else None
+
+    def ultimos(self, n=20):
+        return self._consultar("SELECT id, asunto, estado, intentos, error, creado, enviado FROM correos ORDER BY id DESC LIMIT ?", (n,))
+
+    def _marcar(self, id_correo, estado, intentos, error=None):
+        with self.lock:
+            self.db.execute("UPDATE correos SET estado=?, intentos=?, proximo=?, error=?, enviado=? WHERE id=?",
+                            (estado, intentos, time.time() + min(3600, 30 * 2 ** intentos), error,
+                             time.time() if estado == "ENVIADO" else None, id_correo))
+            self.db.commit()
+
+    def _reclamar(self, id_correo):
+        # Varias réplicas comparten la base: solo la que gana el UPDATE envía el correo
+        with self.lock:
+            ahora = time.time()
+            cur = self.db.execute("""UPDATE correos SET estado='ENVIANDO', proximo=?
+                WHERE id=? AND estado IN ('PENDIENTE','ENVIANDO') AND proximo<=?""", (ahora + PLAZO_ENVIO, id_correo, ahora))
+            self.db.commit()
+            return cur.rowcount == 1
+
+    def _conectar(self, cfg):
+        s = smtplib.SMTP(cfg["host"], cfg["puerto"], timeout=30)
+        if cfg["tls"]: s.starttls()
+        if cfg["password"]: s.login(cfg["usuario"], cfg["password"])
+        return s
+
+    def _cerrar(self):
+        if self.smtp is None: return
+        try: self.smtp.quit()
+        except Exception: pass
+        self.smtp = None
+
+    def _mensaje(self, cfg, asunto, nombre, adjunto):
+        msg = MIMEMultipart(); msg['Subject'] = asunto; msg['From'] = cfg["usuario"]; msg['To'] = cfg["destinatario"]
+        att = MIMEBase('application', 'octet-stream'); att.set_payload(adjunto); encoders.encode_base64(att)
+        att.add_header('Content-Disposition', f"attachment; filename={nombre}"); msg.attach(att)
+        return msg.as_string()
+
+    def drenar(self):
+        filas = self._consultar("""SELECT id, asunto, adjunto_nombre, adjunto, intentos
+            FROM correos WHERE estado IN ('PENDIENTE','ENVIANDO') AND proximo<=? ORDER BY id""", (time.time(),))
+        if filas:
+            cfg = self.config()
+            # El servidor puede haber cortado la conexión ociosa: un NOOP por ráfaga antes de reutilizarla
+            try:
+                if self.smtp is not None and self.smtp.noop()[0] != 250: self._cerrar()
+            except Exception: self.smtp = None
+        for id_correo, asunto, nombre, adjunto, intentos in filas:
+            if not self._reclamar(id_correo): continue  # ya lo está enviando otra réplica
+            t0 = time.perf_counter()
+            try:
+                # Una sola conexión autenticada para toda la ráfaga (y las que lleguen mientras siga abierta)
+                if self.smtp is None: self.smtp = self._conectar(cfg)
+                self.smtp.sendmail(cfg["usuario"], cfg["destinatario"], self._mensaje(cfg, asunto, nombre, adjunto))
+                self.t_uso = time.time()
+                self._marcar(id_correo, "ENVIADO", intentos)
+                if self.metricas: self.metricas.registrar("smtp", (time.perf_counter() - t0) * 1000, len(adjunto))
+            except Exception as e:
+                if self.metricas: self.metricas.registrar("smtp", (time.perf_counter() - t0) * 1000, len(adjunto), resultado=type(e).__name__)
+                self._marcar(id_correo, "FALLIDO" if intentos + 1 >= MAX_INTENTOS_CORREO else "PENDIENTE", intentos + 1, str(e))
+                if isinstance(e, ERRORES_MENSAJE): continue
+                # Conexión caída, login o red: el resto de la ráfaga espera a la siguiente vuelta
+                self._cerrar()
+                break
+        with self.lock:
+            self.db.execute("DELETE FROM correos WHERE estado='ENVIADO' AND creado<?", (time.time() - 30 * 86400,))
+            self.db.commit()
+        return len(filas)
+
+    def arrancar(self):
+        threading.Thread(target=self._bucle, name="correo", daemon=True).start()
+
+    def _bucle(self):
+        while True:
+            self.aviso.wait(timeout=15)
+            self.aviso.clear()
+            try: self.drenar()
+            except Exception: pass
+            if self.smtp is not None and time.time() - self.t_uso > INACTIVIDAD_SMTP: self._cerrar()
@@ -0,0 +1,151 @@
+# ==========================================
+#     DIARIO LOCAL DE ESCRITURAS (OFFLINE)
+# ==========================================
+# Cola en SQLite de las escrituras a Google, volcada por un hilo de fondo con reintentos.
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from planificador import error_permanente
+
+MAX_INTENTOS = 20
+VENTANA_COMMIT = 0.3  # s para juntar los guardados de todas las tablets en un batchUpdate por archivo
+PLAZO_ENVIO = 120  # s que un grupo reclamado (ENVIANDO) es de la réplica que lo reclamó; si muere, se retoma
+
+class DiarioEscrituras:
+    def __init__(self, ruta, aplicar_celdas, aplicar_parte):
+        self.aplicar_celdas = aplicar_celdas  # (archivo, {hoja: celdas}, backup), lanza excepción si falla
+        self.aplicar_parte = aplicar_parte    # (payload, reintento), lanza excepción si falla
+        self.lock = threading.Lock()
+        self.aviso = threading.Event()
+        self.db = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS escrituras (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, lote TEXT, tipo TEXT, archivo TEXT, backup TEXT, hoja TEXT,
+            fila INTEGER, col INTEGER, valor, nota TEXT, estilo TEXT, payload TEXT,
+            estado TEXT DEFAULT 'PENDIENTE', intentos INTEGER DEFAULT 0, proximo REAL DEFAULT 0, error TEXT, creado REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_escrituras_estado ON escrituras (estado, proximo)")
+        self.db.commit()
+
+    def _insertar(self, filas):
+        lote = uuid.uuid4().hex
+        with self.lock:
+            self.db.executemany("""INSERT INTO escrituras (lote, tipo, archivo, backup, hoja, fila, col, valor, nota, estilo, payload, creado)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?)""", [(lote,) + f + (time.time(),) for f in filas])
+            self.db.commit()
+        self.aviso.set()
+        return lote
+
+    def encolar_celdas(self, archivo, backup, hoja, celdas):
+        return self._insertar([("CELDA", archivo, backup or "", hoja, c['fila'], c['col'], c['valor'], c.get('nota') or "", c.get('estilo') or "", None) for c in celdas])
+
+    def encolar_parte(self, archivo, payload):
+        return self._insertar([("PARTE", archivo, "", "", None, None, None, None, None, json.dumps(payload))])
+
+    def _consultar(self, sql, params=()):
+        with self.lock: return self.db.execute(sql, params).fetchall()
+
+    def pendientes(self): return self._consultar("SELECT COUNT(DISTINCT lote) FROM escrituras WHERE estado IN ('PENDIENTE','ENVIANDO')")[0][0]
+    def fallidas(self): return self._consultar("SELECT COUNT(DISTINCT lote) FROM escrituras WHERE estado='FALLIDO'")[0][0]
+
+    def celdas_pendientes(self, archivo, hoja):
+        return {(f, c) for f, c in self._consultar("SELECT fila, col FROM escrituras WHERE estado IN ('PENDIENTE','ENVIANDO') AND tipo='CELDA' AND archivo=? AND hoja=?", (archivo, hoja))}
+
+    def partes_pendientes(self, archivo):
+        return [json.loads(p) for (p,) in self._consultar("SELECT payload FROM escrituras WHERE estado IN ('PENDIENTE','ENVIANDO') AND tipo='PARTE' AND archivo=?", (archivo,))]
+
+    def estado_lote(self, lote):
+        estados = {e for (e,) in self._consultar("SELECT DISTINCT estado FROM escrituras WHERE lote=?", (lote,))}
+        if "FALLIDO" in estados: return "FALLIDO"
+        return "PENDIENTE" if estados & {"PENDIENTE", "ENVIANDO"} else "HECHO"
+
+    def _marcar(self, ids, estado, intentos=0, error=None):
+        marcas = ",".join("?" * len(ids))
+        with self.lock:
+            self.db.execute(f"UPDATE escrituras SET estado=?, intentos=?, proximo=?, error=? WHERE id IN ({marcas})",
+                            [estado, intentos, time.time() + min(300, 2 ** intentos), error] + ids)
+            self.db.commit()
+
+    def _reclamar(self, ids):
+        # Varias réplicas comparten la base: el grupo solo se envía si esta réplica se queda con todas sus filas
+        marcas, ahora = ",".join("?" * len(ids)), time.time()
+        with self.lock:
+            cur = self.db.execute(f"""UPDATE escrituras SET estado='ENVIANDO', proximo=?
+                WHERE id IN ({marcas}) AND estado IN ('PENDIENTE','ENVIANDO') AND proximo<=?""", [ahora + PLAZO_ENVIO] + ids + [ahora])
+            if cur.rowcount != len(ids):
+                self.db.rollback(); return False
+            self.db.commit()
+            return True
+
+    def _liberar(self, ids):
+        marcas = ",".join("?" * len(ids))
+        with self.lock:
+            self.db.execute(f"UPDATE escrituras SET estado='PENDIENTE', proximo=0 WHERE id IN ({marcas}) AND estado='ENVIANDO'", ids)
+            self.db.commit()
+
+    def _fallar(self, ids, intentos, error):
+        # Un error permanente pasa a FALLIDO al momento: no deja esperando al resto del archivo
+        final = error_permanente(error) or intentos + 1 >= MAX_INTENTOS
+        self._marcar(ids, "FALLIDO" if final else "PENDIENTE", intentos + 1, str(error))
+
+    def _enviar(self, clave, fs, marcar_fallo=True):
+        ids, intentos = [f[0] for f in fs], max(f[12] for f in fs)
+        try:
+            if clave[0] == "CELDA":
+                por_hoja = {}
+                for f in fs: por_hoja.setdefault(f[5], []).append({"fila": f[6], "col": f[7], "valor": f[8], "nota": f[9], "estilo": f[10] or None})
+                self.aplicar_celdas(clave[1], por_hoja, clave[2])
+            else: self.aplicar_parte(json.loads(fs[0][11]), intentos > 0)
+            self._marcar(ids, "HECHO", intentos)
+            return None
+        except Exception as e:
+            if marcar_fallo: self._fallar(ids, intentos, e)
+            return e
+
+    def drenar(self):
+        filas = self._consultar("""SELECT id, lote, tipo, archivo, backup, hoja, fila, col, valor, nota, estilo, payload, intentos, proximo
+            FROM escrituras WHERE estado IN ('PENDIENTE','ENVIANDO') ORDER BY id""")
+        # Orden por archivo: nada sale por delante de una escritura más antigua del mismo archivo que
+        # espera su reintento o que otra réplica está enviando (si no, al reenviarse pisaría el valor
+        # nuevo, p. ej. un TENDIDO a un GRAPADO)
+        ahora, en_espera, listas = time.time(), set(), []
+        for f in filas:
+            if f[3] in en_espera: continue
+            if f[13] > ahora: en_espera.add(f[3])
+            else: listas.append(f)
+        # Un solo batchUpdate por archivo aunque las celdas vengan de varias hojas, lotes y sesiones
+        grupos = {}
+        for f in listas:
+            clave = ("CELDA", f[3], f[4]) if f[2] == "CELDA" else ("PARTE", f[1])
+            grupos.setdefault(clave, []).append(f)
+        for clave, fs in grupos.items():
+            lotes = {}
+            for f in fs: lotes.setdefault(f[1], []).append(f)
+            if not self._reclamar([f[0] for f in fs]): continue  # otra réplica se adelantó
+            error = self._enviar(clave, fs, marcar_fallo=len(lotes) == 1)
+            # Si el envío conjunto lo rechaza un lote (4xx, pestaña borrada), cada lote va por su cuenta para
+            # que uno malo no tumbe a los demás; una cuota, un 5xx o la red afectan a todos y se reintenta el grupo
+            if error is None or len(lotes) == 1: continue
+            if not error_permanente(error): self._fallar([f[0] for f in fs], max(f[12] for f in fs), error)
+            else:
+                # Por orden de llegada; tras uno que queda esperando reintento, los siguientes esperan con él
+                restantes = list(lotes.values())
+                while restantes:
+                    e = self._enviar(clave, restantes.pop(0))
+                    if e is not None and not error_permanente(e): break
+                for fl in restantes: self._liberar([f[0] for f in fl])
+        with self.lock:
+            self.db.execute("DELETE FROM escrituras WHERE estado='HECHO' AND creado<?", (time.time() - 7 * 86400,))
+            self.db.commit()
+        return len(grupos)
+
+    def arrancar(self):
+        threading.Thread(target=self._bucle, name="diario-escrituras", daemon=True).start()
+
+    def _bucle(self):
+        while True:
+            if self.aviso.wait(timeout=15): time.sleep(VENTANA_COMMIT)  # ventana para juntar guardados
+            self.aviso.clear()
+            try: self.drenar()
+            except Exception: pass
@@ -0,0 +1,127 @@
+# ==========================================
+#     PARTE DIARIO EN PDF
+# ==========================================
+# Parte diario en PDF (reportlab), paginado, con el esqueleto fijo como form XObject.
+from io import BytesIO
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+X_COLS = [40, 180, 260, 330, 400, 450, 500, 555]
+CABECERAS = ["Employee Name", "ID Number", "Company", "Profession", "Normal", "Extra", "Night"]
+ALTO_FILA = 20
+FONDO_FILAS = 40      # última línea de tabla posible en una página
+ALTO_MIN_TABLA = 400  # en la 1ª página la tabla se rellena con líneas vacías hasta h - 400
+TOPE_PRODUCCION = 130 # el bloque de producción acaba encima del de firma (30..120)
+
+def definir_plantillas(c, h):
+    # Una vez por documento: reportlab no comparte forms entre canvas
+    # Cabecera de la 1ª página: recuadro y etiquetas (los valores se escriben encima)
+    c.beginForm("marco")
+    y = h - 90
+    c.setLineWidth(1); c.rect(40, y - 60, 515, 70)
+    c.setFont("Helvetica-Bold", 16); c.drawString(50, h - 50, "Daily Work Log - SEMI ISRAEL")
+    c.setFont("Helvetica", 10); c.drawString(400, h - 50, "Israel Railways Project")
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(50, y - 15, "Date:"); c.drawString(250, y - 15, "Vehicle / Location:")
+    c.drawString(50, y - 45, "Start Time:"); c.drawString(200, y - 45, "End Time:")
+    c.drawString(350, y - 45, "Weather: ________")
+    c.endForm()
+    # Cabecera de las páginas siguientes
+    c.beginForm("continuacion")
+    c.setFont("Helvetica-Bold", 12); c.drawString(50, h - 40, "Daily Work Log - SEMI ISRAEL (cont.)")
+    c.setLineWidth(0.5); c.line(40, h - 48, 555, h - 48)
+    c.endForm()
+    # Barra azul de columnas, con origen en su borde inferior (se coloca con translate)
+    c.beginForm("cabecera_tabla")
+    c.setFillColor(colors.HexColor("#2980B9")); c.rect(40, 0, 515, ALTO_FILA, fill=1); c.setFillColor(colors.white)
+    c.setFont("Helvetica-Bold", 8)
+    for x, texto in zip(X_COLS, CABECERAS): c.drawString(x + 5, 6, texto)
+    c.endForm()
+    # Maquinaria y firma, al pie de la última página
+    c.beginForm("pie")
+    c.setLineWidth(1); c.rect(40, 30, 515, 90); c.setFont("Helvetica-Bold", 10)
+    c.drawString(50, 100, "Machinery / Materials:"); c.line(40, 70, 555, 70)
+    c.drawString(50, 50, "SIGNATURE (ENCARGADO): __________________________")
+    c.endForm()
+
+def generar_pdf(fecha, jefe, lista, para, prod):
+    b = BytesIO()
+    c = canvas.Canvas(b, pagesize=A4); _, h = A4
+    definir_plantillas(c, h)
+    inicio, fin = (lista[0]['H_Inicio'], lista[0]['H_Fin']) if lista else ("________", "________")
+    pagina = [1]
+
+    def cabecera():
+        # Devuelve la y donde empieza el contenido de la página
+        if pagina[0] == 1:
+            c.doForm("marco")
+            c.setFillColor(colors.black); c.setFont("Helvetica-Bold", 10)
+            for x, y, etiqueta, valor in ((50, h - 105, "Date:", fecha), (250, h - 105, "Vehicle / Location:", jefe),
+                                          (50, h - 135, "Start Time:", inicio), (200, h - 135, "End Time:", fin)):
+                c.drawString(x + stringWidth(etiqueta + " ", "Helvetica-Bold", 10), y, str(valor))
+            return h - 170
+        c.doForm("continuacion")
+        c.setFillColor(colors.black); c.setFont("Helvetica", 9)
+        c.drawRightString(555, h - 40, f"{fecha} · {jefe} · Page {pagina[0]}")
+        return h - 80
+
+    def nueva_pagina():
+        c.showPage(); pagina[0] += 1
+        return cabecera()
+
+    def cabecera_tabla(y):
+        c.saveState(); c.translate(0, y); c.doForm("cabecera_tabla"); c.restoreState()
+        c.setFillColor(colors.black); c.setFont("Helvetica", 9)
+
+    def rejilla(y_tabla, y_ultima):
+        c.setLineWidth(1)
+        for x in X_COLS: c.line(x, y_tabla + ALTO_FILA, x, y_ultima)
+
+    # --- Tabla de personal: paginada, con la barra de columnas repetida en cada página ---
+    y_tabla = cabecera(); cabecera_tabla(y_tabla); y = y_tabla - ALTO_FILA
+    for t in lista:
+        if y < FONDO_FILAS:
+            rejilla(y_tabla, y + ALTO_FILA)
+            y_tabla = nueva_pagina(); cabecera_tabla(y_tabla); y = y_tabla - ALTO_FILA
+        h_base = 8.0 if t['Total_Horas'] > 8 else t['Total_Horas']
+        h_extra = t['Total_Horas'] - 8.0 if t['Total_Horas'] > 8 else 0.0
+        col_base = 6 if t['Es_Noche'] else 4
+        c.drawString(X_COLS[0] + 5, y + 6, t['Nombre'][:25])
+        c.drawString(X_COLS[1] + 5, y + 6, str(t['ID']))
+        c.drawString(X_COLS[2] + 5, y + 6, "SEMI")
+        c.drawString(X_COLS[3] + 5, y + 6, "Official")
+        c.drawString(X_COLS[col_base] + 10, y + 6, f"{h_base:g}")
+        if h_extra > 0: c.drawString(X_COLS[5] + 10, y + 6, f"{h_extra:g}")
+        c.setLineWidth(0.5); c.line(40, y, 555, y); y -= ALTO_FILA
+    if pagina[0] == 1:
+        while y > h - ALTO_MIN_TABLA: c.setLineWidth(0.5); c.line(40, y, 555, y); y -= ALTO_FILA
+    rejilla(y_tabla, y + ALTO_FILA)
+
+    # --- Paralización, producción y firma; si no caben, a una página nueva ---
+    items = [f"- {k}: {','.join(v)}" for k, v in (prod or {}).items()]
+    y_bloque = y + ALTO_FILA - 40
+    necesario = (70 if para else 0) + 35 + ALTO_FILA * max(1, min(len(items), 5)) + 10
+    if y_bloque - necesario < TOPE_PRODUCCION: y_bloque = nueva_pagina()
+    if para:
+        c.setStrokeColor(colors.red); c.setLineWidth(2); c.rect(40, y_bloque - 50, 515, 50)
+        c.setFillColor(colors.red); c.setFont("Helvetica-Bold", 10); c.drawString(50, y_bloque - 15, "⚠️ DELAY")
+        c.setFillColor(colors.black); c.setFont("Helvetica", 10); c.drawString(50, y_bloque - 35, f"{para['inicio']}-{para['fin']} | {para['motivo']}")
+        c.setStrokeColor(colors.black); c.setLineWidth(1); y_bloque -= 70
+    y_act = y_bloque
+    while True:
+        c.setLineWidth(1); c.setFont("Helvetica-Bold", 10); c.drawString(50, y_act - 15, "Production:")
+        yl = y_act - 35; c.setFont("Helvetica", 9)
+        while items and yl > TOPE_PRODUCCION + 5:
+            c.drawString(50, yl + 5, items.pop(0)); c.line(40, yl, 555, yl); yl -= ALTO_FILA
+        if not items: break
+        c.rect(40, TOPE_PRODUCCION, 515, y_act - TOPE_PRODUCCION); y_act = nueva_pagina()
+    while yl > TOPE_PRODUCCION + 5: c.line(40, yl, 555, yl); yl -= ALTO_FILA
+    c.setLineWidth(1); c.rect(40, TOPE_PRODUCCION, 515, y_act - TOPE_PRODUCCION)
+    c.doForm("pie")
+    c.save(); b.seek(0); return b
+
+def pdf_bytes(args):
+    # Para ProcessPoolExecutor.map: (fecha, jefe, lista, para, prod) -> bytes del PDF
+    return generar_pdf(*args).getvalue()
@@ -0,0 +1,94 @@
+# ==========================================
+#     PLANIFICADOR DE LLAMADAS A GOOGLE
+# ==========================================
+# Cuotas de Sheets, reintentos ante 429/5xx y prioridad de lo interactivo sobre el fondo.
+import random
+import threading
+import time
+import gspread
+
+BYTES_VALOR = 12  # lo que ocupa de media en JSON un número, una fecha o un objeto opaco
+
+def tamano_aprox(obj, nivel=0):
+    # Tamaño aproximado en JSON sin serializar: las listas (filas, celdas, peticiones) se estiman
+    # por su primer elemento y su longitud, así una tabla de 10.000 filas cuesta lo mismo que una
+    if isinstance(obj, (str, bytes)): return len(obj) + 2
+    if nivel > 6: return BYTES_VALOR
+    if isinstance(obj, list): return 2 + len(obj) * (tamano_aprox(obj[0], nivel + 1) + 1) if obj else 2
+    if isinstance(obj, tuple): return 2 + sum(tamano_aprox(x, nivel + 1) + 1 for x in obj)
+    if isinstance(obj, dict): return 2 + sum(len(str(k)) + 4 + tamano_aprox(v, nivel + 1) for k, v in obj.items())
+    return 0 if obj is None else BYTES_VALOR
+
+CUOTAS_SHEETS = {"proyecto": 300, "usuario": 60}  # peticiones/minuto, lectura y escritura por separado
+CODIGOS_REINTENTO = {429, 500, 502, 503, 504}
+INTERACTIVO, FONDO = 0, 1
+HILOS_FONDO = ("refresco", "hojas", "espejo")  # thread_name_prefix de los hilos de recarga y backup
+
+def codigo_http(error):
+    if isinstance(error, gspread.exceptions.APIError): return error.code
+    resp = getattr(error, "resp", None)  # googleapiclient HttpError
+    return getattr(resp, "status", None)
+
+def error_permanente(error):
+    # Reintentar no lo arregla: pestaña que no existe, petición mal formada, sin permiso...
+    codigo = codigo_http(error)
+    return isinstance(error, gspread.WorksheetNotFound) or (codigo is not None and 400 <= codigo < 500 and codigo != 429)
+
+def carril_actual():
+    return FONDO if threading.current_thread().name.startswith(HILOS_FONDO) else INTERACTIVO
+
+class CuboTokens:
+    def __init__(self, por_minuto, reloj=time.monotonic):
+        self.capacidad, self.tasa, self.reloj = por_minuto, por_minuto / 60.0, reloj
+        self.tokens, self.t = float(por_minuto), reloj()
+
+    def espera(self):
+        ahora = self.reloj()
+        self.tokens, self.t = min(self.capacidad, self.tokens + (ahora - self.t) * self.tasa), ahora
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.tasa
+
+    def tomar(self): self.tokens -= 1
+    def vaciar(self): self.tokens = min(self.tokens, 0)
+
+class PlanificadorGoogle:
+    def __init__(self, cuotas=CUOTAS_SHEETS, reintentos=6, base=1.0, tope=32.0, dormir=time.sleep, reloj=time.monotonic, metricas=None):
+        self.reintentos, self.base, self.tope, self.dormir, self.metricas = reintentos, base, tope, dormir, metricas
+        # Drive va sin cubo (su cuota es muy superior) pero sí con reintentos
+        self.cubos = {tipo: [CuboTokens(n, reloj) for n in cuotas.values()] for tipo in ("lectura", "escritura")}
+        self.cubos["drive"] = []
+        self.cond = threading.Condition()
+        self.esperando = {INTERACTIVO: 0, FONDO: 0}
+
+    def _turno(self, tipo, carril):
+        with self.cond:
+            self.esperando[carril] += 1
+            try:
+                while True:
+                    # El carril de fondo cede mientras haya interactivos esperando turno
+                    if carril == FONDO and self.esperando[INTERACTIVO]:
+                        self.cond.wait(0.1); continue
+                    espera = max([c.espera() for c in self.cubos[tipo]] or [0])
+                    if espera <= 0:
+                        for c in self.cubos[tipo]: c.tomar()
+                        return
+                    self.cond.wait(espera)
+            finally:
+                self.esperando[carril] -= 1
+                self.cond.notify_all()
+
+    def llamar(self, tipo, fn, *args, op=None, **kwargs):
+        carril, op = carril_actual(), op or getattr(fn, "__name__", tipo)
+        for intento in range(self.reintentos + 1):
+            self._turno(tipo, carril)
+            t0 = time.perf_counter()
+            try:
+                resultado = fn(*args, **kwargs)
+                if self.metricas: self.metricas.registrar(op, (time.perf_counter() - t0) * 1000, tamano_aprox((args, kwargs)) + tamano_aprox(resultado), google=True)
+                return resultado
+            except Exception as e:
+                if self.metricas: self.metricas.registrar(op, (time.perf_counter() - t0) * 1000, tamano_aprox((args, kwargs)), str(codigo_http(e) or type(e).__name__), google=True)
+                if codigo_http(e) not in CODIGOS_REINTENTO or intento == self.reintentos: raise
+                if codigo_http(e) == 429:
+                    with self.cond:
+                        for c in self.cubos[tipo]: c.vaciar()  # todos frenan, no solo quien recibió el 429
+                self.dormir(random.uniform(0, min(self.tope, self.base * 2 ** intento)))
@@ -0,0 +1,44 @@
+# ==========================================
+#     PETICIONES DEL PARTE AL ROSTER
+# ==========================================
+# Peticiones batchUpdate de un parte: horas y turno en el Roster y fila en Paralizaciones.
+import uuid
+
+def valor_crudo(valor):
+    # Igual que RAW en update_cells/append_row: números como número y el resto como texto
+    if isinstance(valor, (int, float)): return {"numberValue": valor}
+    return {"stringValue": "" if valor is None else str(valor)}
+
+CABECERA_PARALIZACIONES = ["Fecha", "Vehiculo/Lugar", "Inicio", "Fin", "Horas", "Motivo", "Usuario", "Ref"]
+
+def fila_append(sheet_id, valores):
+    return {"appendCells": {"sheetId": sheet_id, "rows": [{"values": [{"userEnteredValue": valor_crudo(v)} for v in valores]}], "fields": "userEnteredValue"}}
+
+def nota_roster(vehiculo, trabajador, usuario):
+    return f"🚛 {vehiculo}\n🕒 {trabajador['H_Inicio']}-{trabajador['H_Fin']}\n👷 {usuario}"
+
+def peticiones_parte(modelo, fecha, lista, vehiculo, para, usuario="", ref="", refs_previas=None):
+    # Horas, letras de turno y la fila de Paralizaciones van en un único batchUpdate.
+    # La letra lleva en nota vehículo y horario: con eso se rehacen los partes en lote.
+    # refs_previas(ws) -> columna Ref de Paralizaciones; solo se pasa al reenviar desde el diario.
+    # Devuelve (peticiones, hoja_nueva)
+    c_idx = modelo['dias'].get(str(fecha.day), 14)
+    peticiones = []
+    for t in lista:
+        if t['ID'] not in modelo['filas']: continue
+        inicio = {"sheetId": modelo['ws'].id, "rowIndex": modelo['filas'][t['ID']] - 1, "columnIndex": c_idx - 1}
+        peticiones.append({"updateCells": {"start": inicio, "fields": "userEnteredValue",
+            "rows": [{"values": [{"userEnteredValue": valor_crudo(t['Turno_Letra'])}, {"userEnteredValue": valor_crudo(t['Total_Horas'])}]}]}})
+        peticiones.append({"updateCells": {"start": inicio, "fields": "note",
+            "rows": [{"values": [{"note": nota_roster(vehiculo, t, usuario)}]}]}})
+    wp, hoja_nueva = modelo['ws_para'], False
+    if para:
+        if wp is None:
+            id_para, hoja_nueva = uuid.uuid4().int % 2**31, True
+            peticiones.append({"addSheet": {"properties": {"sheetId": id_para, "title": "Paralizaciones", "gridProperties": {"rowCount": 1000, "columnCount": 10}}}})
+            peticiones.append(fila_append(id_para, CABECERA_PARALIZACIONES))
+        else: id_para = wp.id
+        # Al reenviar desde el diario no se duplica la fila si ya llegó en el intento anterior
+        if not (refs_previas and ref and wp is not None and ref in refs_previas(wp)):
+            peticiones.append(fila_append(id_para, [str(fecha.date()), vehiculo, para['inicio'], para['fin'], para['duracion'], para['motivo'], usuario, ref]))
+    return peticiones, hoja_nueva
@@ -0,0 +1,122 @@
+import socket
+import time
+import pytest
+from correo import BandejaCorreo, MAX_INTENTOS_CORREO
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+
+class ServidorFalso:
+    # Handler de aiosmtpd: cuenta conexiones (un EHLO por conexión), guarda lo entregado y rechaza destinatarios
+    def __init__(self):
+        self.conexiones, self.entregados, self.rechazados = 0, [], set()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.conexiones += 1; session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.rechazados: return "550 5.1.1 no such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.entregados.append(envelope.rcpt_tos[0])
+        return "250 OK"
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+@pytest.fixture
+def smtp():
+    servidor = ServidorFalso()
+    controlador = Controller(servidor, hostname="127.0.0.1", port=puerto_libre())
+    controlador.start()
+    yield servidor, controlador
+    try: controlador.stop()
+    except Exception: pass
+
+def config(smtp):
+    return {"host": "127.0.0.1", "puerto": smtp[1].port, "tls": False, "usuario": "partes@semi.test", "password": "", "destinatario": "jefe@semi.test"}
+
+@pytest.fixture
+def bandeja(tmp_path, smtp):
+    b = BandejaCorreo(str(tmp_path / "diario.db"), lambda: config(smtp), None)
+    yield b
+    b._cerrar()
+
+def filas(b):
+    return b._consultar("SELECT estado, intentos, proximo, error, enviado FROM correos ORDER BY id")
+
+def vencer_esperas(b):
+    with b.lock:
+        b.db.execute("UPDATE correos SET proximo=0"); b.db.commit()
+
+def test_rafaga_usa_una_sola_conexion(bandeja, smtp):
+    servidor, _ = smtp
+    ids = [bandeja.encolar(f"Parte {i}", f"Parte_{i}.pdf", b"%PDF-1.4 falso") for i in range(5)]
+    assert bandeja.drenar() == 5
+    assert servidor.conexiones == 1 and len(servidor.entregados) == 5
+    # La siguiente ráfaga reutiliza la conexión que sigue abierta (NOOP y sendmail, sin EHLO nuevo)
+    ids.append(bandeja.encolar("Parte 5", "Parte_5.pdf", b"%PDF-1.4 falso"))
+    bandeja.drenar()
+    assert servidor.conexiones == 1 and len(servidor.entregados) == 6
+    assert [bandeja.estado(i) for i in ids] == ["ENVIADO"] * 6
+    assert all(intentos == 0 and enviado for _, intentos, _, _, enviado in filas(bandeja))
+
+def test_rechazo_espera_y_se_reintenta(bandeja, smtp):
+    servidor, _ = smtp
+    servidor.rechazados.add("jefe@semi.test")
+    id_correo = bandeja.encolar("Parte", "Parte.pdf", b"%PDF-1.4 falso")
+    bandeja.drenar()
+    [(estado, intentos, proximo, error, enviado)] = filas(bandeja)
+    assert (estado, intentos, enviado) == ("PENDIENTE", 1, None)
+    assert "550" in error and proximo > time.time() + 30
+    # Mientras no venza la espera no se vuelve a intentar
+    servidor.rechazados.clear()
+    bandeja.drenar()
+    assert servidor.entregados == [] and bandeja.estado(id_correo) == "PENDIENTE"
+    vencer_esperas(bandeja)
+    bandeja.drenar()
+    [(estado, intentos, _, _, enviado)] = filas(bandeja)
+    assert (estado, intentos) == ("ENVIADO", 1) and enviado is not None
+    assert servidor.entregados == ["jefe@semi.test"]
+
+def test_servidor_caido_deja_la_rafaga_pendiente(bandeja, smtp):
+    _, controlador = smtp
+    controlador.stop()
+    for i in range(3): bandeja.encolar(f"Parte {i}", f"Parte_{i}.pdf", b"%PDF-1.4 falso")
+    bandeja.drenar()
+    # El primero cuenta el fallo de conexión; el resto espera a la siguiente vuelta sin gastar intentos
+    assert [(e, n) for e, n, _, _, _ in filas(bandeja)] == [("PENDIENTE", 1), ("PENDIENTE", 0), ("PENDIENTE", 0)]
+    assert bandeja.smtp is None
+
+def test_agotar_intentos_marca_fallido(bandeja, smtp):
+    servidor, _ = smtp
+    servidor.rechazados.add("jefe@semi.test")
+    id_correo = bandeja.encolar("Parte", "Parte.pdf", b"%PDF-1.4 falso")
+    with bandeja.lock:
+        bandeja.db.execute("UPDATE correos SET intentos=? WHERE id=?", (MAX_INTENTOS_CORREO - 1, id_correo)); bandeja.db.commit()
+    bandeja.drenar()
+    assert bandeja.estado(id_correo) == "FALLIDO" and bandeja.fallidos() == 1
+
+def test_dos_replicas_no_envian_dos_veces(tmp_path, bandeja, smtp):
+    servidor, _ = smtp
+    # La otra réplica vacía la bandeja justo después de que esta haya leído sus filas
+    otra = BandejaCorreo(str(tmp_path / "diario.db"), lambda: config(smtp), None)
+    bandeja.config = lambda: (otra.drenar(), config(smtp))[1]
+    ids = [bandeja.encolar(f"Parte {i}", f"Parte_{i}.pdf", b"%PDF-1.4 falso") for i in range(3)]
+    bandeja.drenar()
+    otra._cerrar()
+    assert len(servidor.entregados) == 3 and [bandeja.estado(i) for i in ids] == ["ENVIADO"] * 3
+
+def test_reclamado_por_un_proceso_muerto_se_retoma(bandeja, smtp):
+    servidor, _ = smtp
+    id_correo = bandeja.encolar("Parte", "Parte.pdf", b"%PDF-1.4 falso")
+    assert bandeja._reclamar(id_correo)
+    bandeja.drenar()
+    assert servidor.entregados == [] and bandeja.estado(id_correo) == "ENVIANDO"
+    vencer_esperas(bandeja)
+    bandeja.drenar()
+    assert servidor.entregados == ["jefe@semi.test"] and bandeja.estado(id_correo) == "ENVIADO"
@@ -0,0 +1,149 @@
+import time
+from datetime import datetime
+from types import SimpleNamespace
+import gspread
+import pytest
+from diario import DiarioEscrituras, MAX_INTENTOS
+from roster import peticiones_parte
+
+class SheetsFalso:
+    # aplicar_celdas / aplicar_parte del diario contra un Roster y una hoja en memoria
+    def __init__(self, fallos=0, perder_respuesta=False):
+        self.fallos, self.perder_respuesta = fallos, perder_respuesta
+        self.celdas, self.envios, self.reintentos = {}, 0, []
+        self.paralizaciones = [["Fecha", "Vehiculo/Lugar", "Inicio", "Fin", "Horas", "Motivo", "Usuario", "Ref"]]
+        self.modelo = {"ws": SimpleNamespace(id=1), "ws_para": SimpleNamespace(id=2), "dias": {"3": 7}, "filas": {"100": 10}}
+
+    def _fallar(self):
+        self.envios += 1
+        if self.fallos:
+            self.fallos -= 1
+            raise Exception("503 falso")
+
+    def aplicar_celdas(self, archivo, por_hoja, backup):
+        self._fallar()
+        # Como abrir_hoja en commit_celdas: una pestaña borrada tumba el batchUpdate entero
+        if "BORRADA" in por_hoja: raise gspread.WorksheetNotFound("BORRADA")
+        for hoja, celdas in por_hoja.items():
+            for c in celdas: self.celdas[(archivo, hoja, c['fila'], c['col'])] = c['valor']
+
+    def aplicar_parte(self, payload, reintento):
+        self.reintentos.append(reintento)
+        refs = (lambda ws: [f[7] for f in self.paralizaciones]) if reintento else None
+        peticiones, _ = peticiones_parte(self.modelo, datetime.fromisoformat(payload['fecha']), payload['lista'],
+                                         payload['vehiculo'], payload['para'], "tablet", payload['ref'], refs)
+        for p in peticiones:
+            if "appendCells" in p:
+                self.paralizaciones.append([next(iter(v["userEnteredValue"].values())) for v in p["appendCells"]["rows"][0]["values"]])
+        # El batchUpdate entró pero la respuesta se perdió: el diario lo dará por fallido y lo reenviará
+        if self.perder_respuesta:
+            self.perder_respuesta = False
+            raise Exception("timeout leyendo la respuesta")
+
+def diario(tmp_path, sheets):
+    return DiarioEscrituras(str(tmp_path / "diario.db"), sheets.aplicar_celdas, sheets.aplicar_parte)
+
+def filas(d):
+    return d._consultar("SELECT estado, intentos, proximo, error FROM escrituras ORDER BY id")
+
+def vencer_esperas(d):
+    with d.lock:
+        d.db.execute("UPDATE escrituras SET proximo=0"); d.db.commit()
+
+CELDA = {"fila": 5, "col": 39, "valor": "03/02/2026", "nota": "", "estilo": "TENDIDO_AZUL"}
+PARTE = {"fecha": "2026-02-03T00:00:00", "vehiculo": "FURGO 1", "ref": "ab12cd34ef56",
+         "lista": [{"ID": "100", "Turno_Letra": "D", "Total_Horas": 8.0, "H_Inicio": "07:00", "H_Fin": "15:00"}],
+         "para": {"inicio": "10:00", "fin": "11:00", "duracion": 1.0, "motivo": "Lluvia"}}
+
+def test_fallo_vuelve_a_pendiente_con_un_intento_mas(tmp_path):
+    sheets = SheetsFalso(fallos=1)
+    d = diario(tmp_path, sheets)
+    lote = d.encolar_celdas("prod", "bk", "HR TRACK 1", [CELDA])
+    d.drenar()
+    [(estado, intentos, proximo, error)] = filas(d)
+    assert (estado, intentos, error) == ("PENDIENTE", 1, "503 falso")
+    assert proximo > time.time()
+    assert d.estado_lote(lote) == "PENDIENTE" and d.celdas_pendientes("prod", "HR TRACK 1") == {(5, 39)}
+    # Mientras dura la espera no se reenvía
+    d.drenar()
+    assert sheets.envios == 1
+    vencer_esperas(d); d.drenar()
+    assert d.estado_lote(lote) == "HECHO" and sheets.celdas == {("prod", "HR TRACK 1", 5, 39): "03/02/2026"}
+
+def test_max_intentos_pasa_a_fallido(tmp_path):
+    sheets = SheetsFalso(fallos=MAX_INTENTOS + 5)
+    d = diario(tmp_path, sheets)
+    lote = d.encolar_celdas("prod", "", "HR TRACK 1", [CELDA])
+    for _ in range(MAX_INTENTOS - 1):
+        vencer_esperas(d); d.drenar()
+    assert filas(d)[0][:2] == ("PENDIENTE", MAX_INTENTOS - 1)
+    vencer_esperas(d); d.drenar()
+    assert filas(d)[0][:2] == ("FALLIDO", MAX_INTENTOS)
+    assert d.estado_lote(lote) == "FALLIDO" and d.fallidas() == 1 and d.pendientes() == 0
+    vencer_esperas(d); d.drenar()
+    assert sheets.envios == MAX_INTENTOS
+
+def test_reenvio_de_parte_no_duplica_la_fila_de_paralizaciones(tmp_path):
+    sheets = SheetsFalso(perder_respuesta=True)
+    d = diario(tmp_path, sheets)
+    lote = d.encolar_parte("roster", PARTE)
+    d.drenar()
+    assert d.estado_lote(lote) == "PENDIENTE" and len(sheets.paralizaciones) == 2
+    vencer_esperas(d); d.drenar()
+    assert d.estado_lote(lote) == "HECHO"
+    assert sheets.reintentos == [False, True]
+    assert [f[7] for f in sheets.paralizaciones[1:]] == ["ab12cd34ef56"]
+
+def test_un_lote_nuevo_no_adelanta_a_uno_en_espera_del_mismo_archivo(tmp_path):
+    sheets = SheetsFalso(fallos=1)
+    d = diario(tmp_path, sheets)
+    d.encolar_celdas("prod", "", "HR TRACK 1", [dict(CELDA, valor="TENDIDO")])
+    d.drenar()
+    nuevo = d.encolar_celdas("prod", "", "HR TRACK 1", [dict(CELDA, valor="GRAPADO")])
+    otro = d.encolar_celdas("otro", "", "HR TRACK 1", [CELDA])
+    d.drenar()
+    assert d.estado_lote(nuevo) == "PENDIENTE" and d.estado_lote(otro) == "HECHO"
+    vencer_esperas(d); d.drenar()
+    assert sheets.celdas[("prod", "HR TRACK 1", 5, 39)] == "GRAPADO"
+
+@pytest.mark.parametrize("n_lotes", [1, 3])
+def test_lotes_de_un_archivo_van_en_un_solo_envio(tmp_path, n_lotes):
+    sheets = SheetsFalso()
+    d = diario(tmp_path, sheets)
+    for i in range(n_lotes): d.encolar_celdas("prod", "", f"HR TRACK {i}", [CELDA])
+    d.drenar()
+    assert sheets.envios == 1 and d.pendientes() == 0
+
+@pytest.mark.parametrize("juntos", [False, True])
+def test_pestana_borrada_falla_al_momento_sin_retener_el_archivo(tmp_path, juntos):
+    sheets = SheetsFalso()
+    d = diario(tmp_path, sheets)
+    malo = d.encolar_celdas("prod", "", "BORRADA", [CELDA])
+    if not juntos: d.drenar()
+    bueno = d.encolar_celdas("prod", "", "HR TRACK 1", [CELDA])
+    d.drenar()
+    assert d.estado_lote(malo) == "FALLIDO" and filas(d)[0][1] == 1
+    assert d.estado_lote(bueno) == "HECHO" and ("prod", "HR TRACK 1", 5, 39) in sheets.celdas
+
+def test_dos_replicas_no_envian_dos_veces(tmp_path):
+    sheets = SheetsFalso()
+    otra = diario(tmp_path, sheets)
+    # La otra réplica drena la misma base mientras esta está enviando el primer grupo
+    def aplicar_celdas(archivo, por_hoja, backup):
+        otra.drenar(); sheets.aplicar_celdas(archivo, por_hoja, backup)
+    d = DiarioEscrituras(str(tmp_path / "diario.db"), aplicar_celdas, sheets.aplicar_parte)
+    d.encolar_celdas("prod", "", "HR TRACK 1", [CELDA])
+    d.encolar_parte("roster", PARTE)
+    d.drenar()
+    assert sheets.envios == 1 and sheets.reintentos == [False]
+    assert len(sheets.paralizaciones) == 2 and d.pendientes() == 0
+
+def test_partes_pendientes_hasta_que_se_vuelcan(tmp_path):
+    sheets = SheetsFalso(perder_respuesta=True)
+    d = diario(tmp_path, sheets)
+    d.encolar_parte("roster", PARTE)
+    d.drenar()
+    assert [t["ID"] for p in d.partes_pendientes("roster") for t in p["lista"]] == ["100"]
+    assert d.partes_pendientes("otro") == []
+    vencer_esperas(d); d.drenar()
+    assert d.partes_pendientes("roster") == []
@@ -0,0 +1,83 @@
+import threading
+import time
+import gspread
+import pytest
+from planificador import PlanificadorGoogle, INTERACTIVO, FONDO, codigo_http
+
+class RespuestaFalsa:
+    def __init__(self, codigo): self.codigo, self.text = codigo, ""
+    def json(self): return {"error": {"code": self.codigo, "message": "falso", "status": "FALSO"}}
+
+def error_api(codigo): return gspread.exceptions.APIError(RespuestaFalsa(codigo))
+
+class Reloj:
+    # Reloj manual: los cubos solo se rellenan cuando la prueba avanza el tiempo
+    def __init__(self): self.t = 0.0
+    def __call__(self): return self.t
+
+class GoogleFalso:
+    # Falla con los códigos dados, en orden, y después responde "ok"
+    def __init__(self, errores): self.errores, self.llamadas = list(errores), 0
+    def __call__(self):
+        self.llamadas += 1
+        if self.errores: raise error_api(self.errores.pop(0))
+        return "ok"
+
+def test_codigo_http():
+    assert codigo_http(error_api(429)) == 429
+    assert codigo_http(type("HttpError", (Exception,), {"resp": type("R", (), {"status": 503})()})()) == 503
+    assert codigo_http(ValueError()) is None
+
+def test_429_vacia_los_cubos_y_reintenta():
+    reloj, vaciados = Reloj(), []
+    def dormir(s):
+        vaciados.append([c.tokens for c in plan.cubos["escritura"]])
+        reloj.t += 60  # cubos llenos otra vez para el siguiente intento
+    plan = PlanificadorGoogle(cuotas={"proyecto": 300, "usuario": 60}, dormir=dormir, reloj=reloj)
+    google = GoogleFalso([429, 429])
+    assert plan.llamar("escritura", google) == "ok"
+    assert google.llamadas == 3
+    assert vaciados == [[0, 0], [0, 0]]
+    # Los cubos de lectura no se tocan
+    assert all(c.tokens == c.capacidad for c in plan.cubos["lectura"])
+
+def test_espera_acotada_y_relanza_al_agotar_reintentos():
+    reloj, esperas = Reloj(), []
+    def dormir(s): esperas.append(s); reloj.t += 60
+    plan = PlanificadorGoogle(reintentos=6, base=1.0, tope=4.0, dormir=dormir, reloj=reloj)
+    google = GoogleFalso([503] * 10)
+    with pytest.raises(gspread.exceptions.APIError):
+        plan.llamar("lectura", google)
+    assert google.llamadas == 7 and len(esperas) == 6
+    assert all(0 <= s <= min(4.0, 2 ** i) for i, s in enumerate(esperas))
+
+def test_error_no_reintentable_sale_a_la_primera():
+    esperas = []
+    plan = PlanificadorGoogle(dormir=esperas.append, reloj=Reloj())
+    google = GoogleFalso([400])
+    with pytest.raises(gspread.exceptions.APIError):
+        plan.llamar("lectura", google)
+    assert google.llamadas == 1 and esperas == []
+
+def esperar(condicion, plazo=5):
+    limite = time.monotonic() + plazo
+    while not condicion():
+        assert time.monotonic() < limite
+        time.sleep(0.01)
+
+def test_carril_de_fondo_cede_al_interactivo():
+    reloj, orden = Reloj(), []
+    plan = PlanificadorGoogle(cuotas={"usuario": 1}, dormir=lambda s: None, reloj=reloj)
+    plan.llamar("lectura", lambda: None)  # se gasta el único token
+    def pedir(nombre): plan.llamar("lectura", lambda: orden.append(nombre))
+    fondo = threading.Thread(target=pedir, args=("fondo",), name="refresco_1")
+    interactivo = threading.Thread(target=pedir, args=("interactivo",), name="sesion")
+    fondo.start(); esperar(lambda: plan.esperando[FONDO] == 1)
+    interactivo.start(); esperar(lambda: plan.esperando[INTERACTIVO] == 1)
+    # Llega un token: aunque el de fondo esperaba antes, se lo lleva el interactivo
+    with plan.cond: reloj.t += 60; plan.cond.notify_all()
+    interactivo.join(5)
+    assert orden == ["interactivo"]
+    with plan.cond: reloj.t += 60; plan.cond.notify_all()
+    fondo.join(5)
+    assert orden == ["interactivo", "fondo"]